@@ -33,6 +33,13 @@ import logging
 
 from .authentication_context import AuthenticationContext
 from .token_cache import TokenCache
+from .refresh_scheduler import RefreshScheduler
+from .http_transport import HttpTransport, RequestsTransport
+from .retry_policy import RetryPolicy
+from .circuit_breaker import CircuitBreaker
+from .instance_discovery_cache import (InstanceDiscoveryCache,
+                                       set_instance_discovery_cache,
+                                       get_instance_discovery_cache)
 from .log import (set_logging_options, 
                   get_logging_options,
                   ADAL_LOGGER_NAME)
@@ -0,0 +1,712 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation. 
+# All rights reserved.
+# 
+# This code is licensed under the MIT License.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+'''Asynchronous token acquisition, for applications running on asyncio.
+
+This module needs Python 3.5 or later, so it is not imported by the adal
+package itself::
+
+    from adal.aio import AsyncAuthenticationContext
+
+Network requests go through an AsyncHttpTransport. The default one,
+StreamTransport, only uses the standard library. Another HTTP client can be
+plugged in by implementing AsyncHttpTransport.send.
+'''
+
+import asyncio
+import json
+import os
+import socket
+import ssl
+from urllib.parse import urlencode, urlparse
+
+from requests.exceptions import ConnectionError as RequestsConnectionError, HTTPError
+from requests.structures import CaseInsensitiveDict
+
+from . import http_transport
+from . import log
+from . import util
+from .adal_error import AdalError
+from .authentication_context import GLOBAL_ADAL_OPTIONS
+from .authority import Authority
+from .cache_driver import (CacheDriver, find_unexpired_entry, _is_invalid_grant,
+                           _remember_invalid_grant)
+from .constants import AADConstants, TokenResponseFields
+from .instance_discovery_cache import get_instance_discovery_cache
+from .mex import Mex
+from .oauth2_client import OAuth2Client, _REQ_OPTION
+from .retry_policy import _now
+from .token_cache import TokenCache, TokenCacheKey, _get_cache_key
+from .token_request import TokenRequest, ACCOUNT_TYPE, OAUTH2_GRANT_TYPE, OAUTH2_PARAMETERS
+from .user_realm import UserRealm
+from .wstrust_request import WSTrustRequest
+
+# pylint: disable=protected-access,arguments-differ
+
+
+class AsyncHttpResponse(object):
+    '''The parts of a requests.Response which ADAL reads.'''
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError('{} Error'.format(self.status_code), response=self)
+
+
+class AsyncHttpTransport(object):
+    '''Sends the HTTP requests of an AsyncAuthenticationContext.'''
+
+    async def send(self, method, url, headers=None, data=None, timeout=None, verify=True):
+        '''Send a request and return its AsyncHttpResponse.
+
+        :param timeout: None, seconds as a float, or a (connect timeout, read
+            timeout) tuple, as for requests.
+        :param verify: True, False, or the path of a CA bundle, as for
+            requests. None means True.
+        '''
+        raise NotImplementedError()
+
+
+def _create_ssl_context(verify):
+    if verify is False:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+    if isinstance(verify, str):
+        return ssl.create_default_context(cafile=verify)
+    return ssl.create_default_context()
+
+
+async def _read_chunked(reader):
+    chunks = []
+    while True:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        if size == 0:
+            await reader.readline()
+            return b''.join(chunks)
+        chunks.append(await reader.readexactly(size))
+        await reader.readline()
+
+
+class StreamTransport(AsyncHttpTransport):
+    '''HTTP/1.1 over asyncio streams, with a new connection per request.
+
+    It needs nothing beyond the standard library, but follows no redirects
+    and supports no proxies.
+    '''
+
+    async def send(self, method, url, headers=None, data=None, timeout=None, verify=True):
+        if isinstance(timeout, tuple):
+            timeout = sum(timeout)
+        return await asyncio.wait_for(
+            self._send(method, url, headers or {}, data, verify), timeout)
+
+    async def _send(self, method, url, headers, data, verify):
+        parts = urlparse(url)
+        secure = parts.scheme == 'https'
+        reader, writer = await asyncio.open_connection(
+            parts.hostname, parts.port or (443 if secure else 80),
+            ssl=_create_ssl_context(verify) if secure else None)
+        try:
+            body = data.encode('utf-8') if isinstance(data, str) else (data or b'')
+            target = parts.path or '/'
+            if parts.query:
+                target += '?' + parts.query
+            lines = ['{} {} HTTP/1.1'.format(method, target),
+                     'Host: {}'.format(parts.netloc),
+                     'Connection: close',
+                     'Content-Length: {}'.format(len(body))]
+            lines.extend('{}: {}'.format(name, value) for name, value in headers.items())
+            writer.write('\r\n'.join(lines).encode('latin-1') + b'\r\n\r\n' + body)
+            await writer.drain()
+
+            status_code = int((await reader.readline()).split()[1])
+            response_headers = CaseInsensitiveDict()
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                response_headers[name.strip()] = value.strip()
+
+            if response_headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                content = await _read_chunked(reader)
+            elif 'Content-Length' in response_headers:
+                content = await reader.readexactly(int(response_headers['Content-Length']))
+            else:
+                content = await reader.read()
+            return AsyncHttpResponse(status_code, response_headers, content)
+        finally:
+            writer.close()
+
+
+async def _send(call_context, logger, operation, method, url, headers, data=None):
+    '''The counterpart of http_transport.send, through the AsyncHttpTransport
+    of call_context.'''
+    policy = call_context.get('retry_policy')
+    started = call_context.get('started') or _now()
+    deadline = call_context.get('deadline')
+    breaker = call_context.get('circuit_breaker')
+    host = urlparse(url).netloc.lower()
+    retries = 0
+    delay = 0
+    while True:
+        remaining = http_transport._remaining_time(call_context, logger, operation)
+        if breaker is not None:
+            breaker.before_request(host)
+        try:
+            resp = await call_context['transport'].send(
+                method, url, headers=headers, data=data,
+                timeout=http_transport._bounded_timeout(
+                    call_context.get('timeout', None), remaining),
+                verify=call_context.get('verify_ssl', None))
+            util.log_return_correlation_id(logger, operation, resp)
+        except Exception as exp: # pylint: disable=broad-except
+            if breaker is not None:
+                breaker.record(host, error=exp)
+            # Stream errors, as the requests errors a retry policy expects
+            if isinstance(exp, asyncio.TimeoutError):
+                exp = socket.timeout()
+            elif isinstance(exp, ConnectionError):
+                exp = RequestsConnectionError()
+            delay = http_transport._retry_delay(policy, retries, delay, started, deadline,
+                                                error=exp)
+            if delay is None:
+                logger.exception("%(operation)s request failed", {"operation": operation})
+                raise
+            logger.warn("%(operation)s request failed, retrying in %(delay).2f seconds",
+                        {"operation": operation, "delay": delay})
+        else:
+            if breaker is not None:
+                breaker.record(host, response=resp)
+            delay = http_transport._retry_delay(policy, retries, delay, started, deadline,
+                                                response=resp)
+            if delay is None:
+                break
+            logger.warn("%(operation)s request returned http status %(status)s, "
+                        "retrying in %(delay).2f seconds",
+                        {"operation": operation, "status": resp.status_code, "delay": delay})
+        await asyncio.sleep(delay)
+        retries += 1
+    http_transport.check_response(operation, resp)
+    return resp
+
+
+# Refreshes in progress, by event loop, cache and the key of the entry they
+# produce. Callers which need the same refresh await the same task.
+_flights = {}
+
+async def _single_flight(key, func):
+    key = (id(asyncio.get_event_loop()), key)
+    flight = _flights.get(key)
+    if flight is None:
+        flight = _flights[key] = asyncio.ensure_future(func())
+        flight.add_done_callback(lambda _: _flights.pop(key, None))
+    # One caller being cancelled must not cancel the refresh for the others
+    return await asyncio.shield(flight)
+
+
+class _AsyncAuthority(Authority):
+
+    def __init__(self, authority_url, validate_authority=True):
+        super(_AsyncAuthority, self).__init__(authority_url, validate_authority)
+        self._discovery = None
+
+    async def validate(self, call_context):
+        if not self._validated:
+            if self._discovery is None:
+                self._discovery = asyncio.ensure_future(self._discover(call_context))
+            await asyncio.shield(self._discovery)
+        self._get_oauth_endpoints()
+
+    async def _discover(self, call_context):
+        self._log = log.Logger('Authority', call_context['log_context'])
+        self._call_context = call_context
+        try:
+            self._log.debug("Performing instance discovery: %(authority)s",
+                            {"authority": self._url.geturl()})
+            if not (self._perform_static_instance_discovery() or
+                    self._perform_cached_instance_discovery()):
+                discovery_endpoint = self._create_instance_discovery_endpoint_from_template(
+                    AADConstants.WORLD_WIDE_AUTHORITY)
+                get_options = util.create_request_options(self)
+                resp = await _send(call_context, self._log, "Instance Discovery", 'GET',
+                                   discovery_endpoint.geturl(), get_options['headers'])
+                get_instance_discovery_cache().add(
+                    self._host, self._tenant, self._parse_instance_discovery_response(resp))
+            self._validated = True
+        finally:
+            self._discovery = None
+
+
+class _AsyncOAuth2Client(OAuth2Client):
+
+    async def get_token(self, oauth_parameters):
+        token_url = self._create_token_url()
+        post_options = util.create_request_options(self, _REQ_OPTION)
+        resp = await _send(self._call_context, self._log, "Get Token", 'POST',
+                           token_url.geturl(), post_options['headers'],
+                           urlencode(oauth_parameters))
+        return self._handle_get_token_response(resp.text)
+
+
+class _AsyncUserRealm(UserRealm):
+
+    async def discover(self):
+        options = util.create_request_options(self, {'headers': {'Accept':'application/json'}})
+        user_realm_url = self._get_user_realm_url()
+        self._log.debug("Performing user realm discovery at: %(user_realm_url)s",
+                        {"user_realm_url": user_realm_url.geturl()})
+        resp = await _send(self._call_context, self._log, 'User Realm Discovery', 'GET',
+                           user_realm_url.geturl(), options['headers'])
+        self._parse_discovery_response(resp.text)
+
+
+class _AsyncMex(Mex):
+
+    async def discover(self):
+        options = util.create_request_options(
+            self, {'headers': {'Content-Type': 'application/soap+xml'}})
+        resp = await _send(self._call_context, self._log, "Mex Get", 'GET',
+                           self._url, options['headers'])
+        self._handle_mex_document(resp.text)
+
+
+class _AsyncWSTrustRequest(WSTrustRequest):
+
+    async def acquire_token(self, username, password):
+        options = self._create_rst_request_options(username, password)
+        resp = await _send(self._call_context, self._log, "WS-Trust RST", 'POST',
+                           self._wstrust_endpoint_url, options['headers'], options['body'])
+        return self._handle_rstr(resp.text)
+
+
+class _AsyncCacheDriver(CacheDriver):
+    '''A CacheDriver whose refresh_function is a coroutine function.'''
+
+    async def find(self, query):
+        if query is None:
+            query = {}
+        self._log.debug('finding with query keys: %(query)s',
+                        {"query": log.scrub_pii(query)})
+        entry, is_resource_tenant_specific = self._load_single_entry_from_cache(query)
+        if entry:
+            return await self._refresh_entry_if_necessary(entry, is_resource_tenant_specific)
+        return None
+
+    async def _refresh_entry_if_necessary(self, entry, is_resource_specific):
+        if is_resource_specific and self._is_expiring(entry):
+            if TokenResponseFields.REFRESH_TOKEN in entry:
+                self._log.info('Cached token is expired at %(date)s.  Refreshing',
+                               {"date": entry[TokenResponseFields.EXPIRES_ON]})
+                return await self._refresh_expired_entry(entry)
+            self.remove(entry)
+            return None
+        elif not is_resource_specific and entry.get(TokenResponseFields.IS_MRRT):
+            if TokenResponseFields.REFRESH_TOKEN in entry:
+                self._log.info('Acquiring new access token from MRRT token.')
+                return await self._acquire_new_token_from_mrrt(entry)
+            self.remove(entry)
+            return None
+        return entry
+
+    async def _redeem_refresh_token(self, key, entry, resource):
+        failure_key = self._check_invalid_grant(key, entry)
+        try:
+            return await self._refresh_function(entry, resource)
+        except AdalError as exp:
+            if _is_invalid_grant(exp):
+                _remember_invalid_grant(failure_key, exp)
+            raise
+
+    async def _refresh_expired_entry(self, entry):
+        key = _get_cache_key(entry)
+
+        async def refresh():
+            refreshed_entry = self._find_refreshed_entry(key, entry)
+            if refreshed_entry:
+                self._log.info('Returning token refreshed by another caller.')
+                return refreshed_entry
+            token_response = await self._redeem_refresh_token(key, entry, None)
+            new_entry = self._create_entry_from_refresh(entry, token_response)
+            self._replace_entry(entry, new_entry)
+            self._log.info('Returning token refreshed after expiry.')
+            return new_entry
+
+        return await _single_flight((id(self._cache), key), refresh)
+
+    async def _acquire_new_token_from_mrrt(self, entry):
+        key = TokenCacheKey(
+            self._authority, self._resource,
+            entry.get(TokenResponseFields._CLIENT_ID), entry.get(TokenResponseFields.USER_ID))
+
+        async def acquire():
+            acquired_entry = self._find_refreshed_entry(key, None)
+            if acquired_entry:
+                self._log.info('Returning token derived from mrrt by another caller.')
+                return acquired_entry
+            token_response = await self._redeem_refresh_token(key, entry, self._resource)
+            new_entry = self._create_entry_from_refresh(entry, token_response)
+            self.add(new_entry)
+            self._log.info('Returning token derived from mrrt refresh.')
+            return new_entry
+
+        return await _single_flight((id(self._cache), key), acquire)
+
+
+class _AsyncTokenRequest(TokenRequest):
+    '''TokenRequest with coroutines for the flows which reach the network.
+
+    _oauth_get_token is a coroutine function, so the inherited helpers which
+    only return its result, like _get_token_with_refresh_token, return an
+    awaitable too.
+    '''
+
+    def _create_user_realm_request(self, username):
+        return _AsyncUserRealm(self._call_context, username,
+                               self._authentication_context.authority.url)
+
+    def _create_mex(self, mex_endpoint):
+        return _AsyncMex(self._call_context, mex_endpoint)
+
+    def _create_wstrust_request(self, wstrust_endpoint, applies_to, wstrust_endpoint_version):
+        return _AsyncWSTrustRequest(self._call_context, wstrust_endpoint, applies_to,
+                                    wstrust_endpoint_version)
+
+    def _create_oauth2_client(self):
+        return _AsyncOAuth2Client(self._call_context, self._authentication_context.authority)
+
+    def _create_cache_driver(self):
+        return _AsyncCacheDriver(
+            self._call_context,
+            self._authentication_context.authority.url,
+            self._resource,
+            self._client_id,
+            self._authentication_context.cache,
+            self._get_token_with_token_response
+        )
+
+    async def _oauth_get_token(self, oauth_parameters):
+        client = self._create_oauth2_client()
+        return await client.get_token(oauth_parameters)
+
+    async def _find_token_from_cache(self):
+        self._cache_driver = self._create_cache_driver()
+        return await self._cache_driver.find(self._create_cache_query())
+
+    async def _find_token_from_cache_or_none(self):
+        try:
+            return await self._find_token_from_cache()
+        except AdalError:
+            self._log.exception('Attempt to look for token in cache resulted in Error')
+            return None
+
+    async def _perform_wstrust_exchange(self, wstrust_endpoint, wstrust_endpoint_version,
+                                        cloud_audience_urn, username, password):
+        wstrust = self._create_wstrust_request(wstrust_endpoint, cloud_audience_urn,
+                                               wstrust_endpoint_version)
+        result = await wstrust.acquire_token(username, password)
+
+        if not result.token:
+            err_template = "Unsuccessful RSTR.\n\terror code: {}\n\tfaultMessage: {}"
+            error_msg = err_template.format(result.error_code, result.fault_message)
+            self._log.info(error_msg)
+            raise AdalError(error_msg)
+
+        return result
+
+    async def _perform_username_password_for_access_token_exchange(
+            self, wstrust_endpoint, wstrust_endpoint_version, cloud_audience_urn,
+            username, password):
+        wstrust_response = await self._perform_wstrust_exchange(
+            wstrust_endpoint, wstrust_endpoint_version, cloud_audience_urn, username, password)
+        return await self._perform_wstrust_assertion_oauth_exchange(wstrust_response)
+
+    async def _get_token_username_password_federated(self, username, password):
+        self._log.debug("Acquiring token with username password for federated user")
+
+        cloud_audience_urn = self._user_realm.cloud_audience_urn
+        wstrust_endpoint = None
+        if self._user_realm.federation_metadata_url:
+            mex_endpoint = self._user_realm.federation_metadata_url
+            self._log.debug("Attempting mex at: %(mex_endpoint)s",
+                            {"mex_endpoint": mex_endpoint})
+            mex_instance = self._create_mex(mex_endpoint)
+            try:
+                await mex_instance.discover()
+                wstrust_endpoint = mex_instance.username_password_policy['url']
+                wstrust_version = mex_instance.username_password_policy['version']
+            except Exception: #pylint: disable=broad-except
+                self._log.warn(
+                    "MEX exchange failed for %(mex_endpoint)s. "
+                    "Attempting fallback to AAD supplied endpoint.",
+                    {"mex_endpoint": mex_endpoint})
+        else:
+            self._log.warn("Unable to retrieve federationMetadataUrl from AAD. "
+                           "Attempting fallback to AAD supplied endpoint.")
+
+        if not wstrust_endpoint:
+            wstrust_endpoint = self._user_realm.federation_active_auth_url
+            if not wstrust_endpoint:
+                raise AdalError('AAD did not return a WSTrust endpoint. Unable to proceed.')
+            wstrust_version = TokenRequest._parse_wstrust_version_from_federation_active_authurl(
+                wstrust_endpoint)
+
+        return await self._perform_username_password_for_access_token_exchange(
+            wstrust_endpoint, wstrust_version, cloud_audience_urn, username, password)
+
+    async def get_token_with_username_password(self, username, password):
+        self._log.debug("Acquiring token with username password.")
+        self._user_id = username
+        token = await self._find_token_from_cache_or_none()
+        if token:
+            return token
+
+        if not self._authentication_context.authority.is_adfs_authority:
+            self._user_realm = self._create_user_realm_request(username)
+            await self._user_realm.discover()
+
+            if self._user_realm.account_type == ACCOUNT_TYPE['Managed']:
+                token = await self._get_token_username_password_managed(username, password)
+            elif self._user_realm.account_type == ACCOUNT_TYPE['Federated']:
+                token = await self._get_token_username_password_federated(username, password)
+            else:
+                raise AdalError(
+                    "Server returned an unknown AccountType: {}".format(
+                        self._user_realm.account_type))
+        else:
+            self._log.info('Skipping user realm discovery for ADFS authority')
+            token = await self._get_token_username_password_managed(username, password)
+
+        self._cache_driver.add(token)
+        return token
+
+    async def get_token_with_client_credentials(self, client_secret):
+        self._log.debug("Getting token with client credentials.")
+        token = await self._find_token_from_cache_or_none()
+        if token:
+            return token
+
+        oauth_parameters = self._create_oauth_parameters(OAUTH2_GRANT_TYPE.CLIENT_CREDENTIALS)
+        oauth_parameters[OAUTH2_PARAMETERS.CLIENT_SECRET] = client_secret
+
+        token = await self._oauth_get_token(oauth_parameters)
+        self._cache_driver.add(token)
+        return token
+
+    async def get_token_with_authorization_code(self, authorization_code, client_secret,
+                                                code_verifier):
+        self._log.info("Getting token with auth code.")
+        oauth_parameters = self._create_oauth_parameters(OAUTH2_GRANT_TYPE.AUTHORIZATION_CODE)
+        oauth_parameters[OAUTH2_PARAMETERS.CODE] = authorization_code
+        if client_secret is not None:
+            oauth_parameters[OAUTH2_PARAMETERS.CLIENT_SECRET] = client_secret
+        if code_verifier is not None:
+            oauth_parameters[OAUTH2_PARAMETERS.CODE_VERIFIER] = code_verifier
+        token = await self._oauth_get_token(oauth_parameters)
+        self._add_token_into_cache(token)
+        return token
+
+    async def get_token_with_certificate(self, certificate, thumbprint, public_certificate):
+        self._log.info("Getting a token via certificate.")
+
+        jwt = self._create_jwt(certificate, thumbprint, public_certificate)
+
+        oauth_parameters = self._create_oauth_parameters(OAUTH2_GRANT_TYPE.CLIENT_CREDENTIALS)
+        oauth_parameters[OAUTH2_PARAMETERS.CLIENT_ASSERTION_TYPE] = OAUTH2_GRANT_TYPE.JWT_BEARER
+        oauth_parameters[OAUTH2_PARAMETERS.CLIENT_ASSERTION] = jwt
+
+        token = await self._find_token_from_cache_or_none()
+        if token:
+            return token
+        return await self._oauth_get_token(oauth_parameters)
+
+    async def get_token_from_cache_with_refresh(self, user_id):
+        self._log.debug("Getting token from cache with refresh if necessary.")
+        self._user_id = user_id
+        return await self._find_token_from_cache()
+
+
+class AsyncAuthenticationContext(object):
+    '''Retrieves authentication tokens from Azure Active Directory, with
+    coroutines which do not block the event loop.
+
+    It takes the same arguments as AuthenticationContext, except proxies, and
+    its acquire methods are coroutine counterparts of those of
+    AuthenticationContext. It may share a TokenCache with other contexts,
+    synchronous or not. Device code flows are not supported.
+    '''
+
+    def __init__(
+            self, authority, validate_authority=None, cache=None,
+            api_version=None, timeout=None, enable_pii=False, verify_ssl=None,
+            transport=None, retry_policy=None, circuit_breaker=None, deadline=None):
+        '''Creates a new AsyncAuthenticationContext object.
+
+        See AuthenticationContext for the common parameters.
+
+        :param AsyncHttpTransport transport: (optional) Sends the HTTP requests.
+            Defaults to a StreamTransport.
+        :param RetryPolicy retry_policy: (optional) Retries requests which
+            were throttled or failed on the server side, waiting with
+            asyncio.sleep. By default nothing is retried.
+        :param CircuitBreaker circuit_breaker: (optional) Fails requests fast
+            to hosts which keep failing. It may be shared with synchronous
+            contexts.
+        :param float deadline: (optional) Seconds each acquisition may take,
+            with all its requests and retries.
+        '''
+        self.authority = _AsyncAuthority(authority, validate_authority is None or validate_authority)
+        self.correlation_id = None
+        env_verify = 'ADAL_PYTHON_SSL_NO_VERIFY' not in os.environ
+        verify = verify_ssl if verify_ssl is not None else env_verify
+        self._call_context = {
+            'options': GLOBAL_ADAL_OPTIONS,
+            'api_version': api_version,
+            'verify_ssl': verify,
+            'timeout': timeout,
+            'enable_pii': enable_pii,
+            'transport': transport or StreamTransport(),
+            'retry_policy': retry_policy,
+            'circuit_breaker': circuit_breaker,
+            }
+        self.cache = cache or TokenCache()
+        self._deadline = deadline
+
+    @property
+    def options(self):
+        return self._call_context['options']
+
+    @options.setter
+    def options(self, val):
+        self._call_context['options'] = val
+
+    def _create_call_context(self, correlation_id=None):
+        started = _now()
+        return dict(
+            self._call_context, started=started,
+            deadline=started + self._deadline if self._deadline is not None else None,
+            log_context=log.create_log_context(
+                correlation_id or self.correlation_id,
+                self._call_context.get('enable_pii', False)))
+
+    async def _acquire_token(self, token_func, correlation_id=None):
+        call_context = self._create_call_context(correlation_id)
+        await self.authority.validate(call_context)
+        return await token_func(call_context)
+
+    async def acquire_token(self, resource, user_id, client_id):
+        '''Gets a token for a given resource via cached tokens.
+
+        See AuthenticationContext.acquire_token.
+        '''
+        if self.authority.validated:
+            entry = find_unexpired_entry(
+                self.cache, self.authority.url, resource, client_id, user_id)
+            if entry is not None:
+                return entry
+
+        def token_func(call_context):
+            token_request = _AsyncTokenRequest(call_context, self, client_id, resource)
+            return token_request.get_token_from_cache_with_refresh(user_id)
+
+        return await self._acquire_token(token_func)
+
+    async def acquire_token_with_username_password(self, resource, username, password,
+                                                   client_id):
+        '''Gets a token for a given resource via user credentials.
+
+        See AuthenticationContext.acquire_token_with_username_password.
+        '''
+        def token_func(call_context):
+            token_request = _AsyncTokenRequest(call_context, self, client_id, resource)
+            return token_request.get_token_with_username_password(username, password)
+
+        return await self._acquire_token(token_func)
+
+    async def acquire_token_with_client_credentials(self, resource, client_id, client_secret):
+        '''Gets a token for a given resource via client credentials.
+
+        See AuthenticationContext.acquire_token_with_client_credentials.
+        '''
+        def token_func(call_context):
+            token_request = _AsyncTokenRequest(call_context, self, client_id, resource)
+            return token_request.get_token_with_client_credentials(client_secret)
+
+        return await self._acquire_token(token_func)
+
+    async def acquire_token_with_authorization_code(self, authorization_code, redirect_uri,
+                                                    resource, client_id, client_secret=None,
+                                                    code_verifier=None):
+        '''Gets a token for a given resource via authorization code for a
+        server app.
+
+        See AuthenticationContext.acquire_token_with_authorization_code.
+        '''
+        def token_func(call_context):
+            token_request = _AsyncTokenRequest(
+                call_context, self, client_id, resource, redirect_uri)
+            return token_request.get_token_with_authorization_code(
+                authorization_code, client_secret, code_verifier)
+
+        return await self._acquire_token(token_func)
+
+    async def acquire_token_with_refresh_token(self, refresh_token, client_id,
+                                               resource, client_secret=None):
+        '''Gets a token for a given resource via refresh tokens.
+
+        See AuthenticationContext.acquire_token_with_refresh_token.
+        '''
+        def token_func(call_context):
+            token_request = _AsyncTokenRequest(call_context, self, client_id, resource)
+            return token_request.get_token_with_refresh_token(refresh_token, client_secret)
+
+        return await self._acquire_token(token_func)
+
+    async def acquire_token_with_client_certificate(self, resource, client_id, certificate,
+                                                    thumbprint, public_certificate=None):
+        '''Gets a token for a given resource via certificate credentials.
+
+        See AuthenticationContext.acquire_token_with_client_certificate.
+        '''
+        def token_func(call_context):
+            token_request = _AsyncTokenRequest(call_context, self, client_id, resource)
+            return token_request.get_token_with_certificate(
+                certificate, thumbprint, public_certificate)
+
+        return await self._acquire_token(token_func)
@@ -24,13 +24,17 @@
 # THE SOFTWARE.
 #
 #------------------------------------------------------------------------------
+from multiprocessing.pool import ThreadPool
 import os
 import threading
 import warnings
 
 from .authority import Authority
 from . import argument
+from .cache_driver import find_unexpired_entry
 from .code_request import CodeRequest
+from .http_transport import RequestsTransport, create_session
+from .retry_policy import _now
 from .token_request import TokenRequest
 from .token_cache import TokenCache
 from . import log
@@ -46,11 +50,16 @@ class AuthenticationContext(object):
 
     For usages, check out the "sample" folder at:
         https://github.com/AzureAD/azure-activedirectory-library-for-python
+
+    An AuthenticationContext may be shared by many threads, together with its
+    token cache. Each call keeps its own log context and correlation id.
     '''
 
     def __init__(
             self, authority, validate_authority=None, cache=None,
-            api_version=None, timeout=None, enable_pii=False, verify_ssl=None, proxies=None):
+            api_version=None, timeout=None, enable_pii=False, verify_ssl=None, proxies=None,
+            stale_while_revalidate=False, session=None, pool_size=10, keep_alive=True,
+            transport=None, retry_policy=None, circuit_breaker=None, deadline=None):
         '''Creates a new AuthenticationContext object.
 
         By default the authority will be checked against a list of known Azure
@@ -87,6 +96,32 @@ class AuthenticationContext(object):
         :param proxies: (optional) requests proxies. Dictionary mapping protocol to the URL 
             of the proxy. See http://docs.python-requests.org/en/master/user/advanced/#proxies
             for details.
+        :param stale_while_revalidate: (optional) When True, acquire_token returns a
+            cached access token which is about to expire, but has not yet, right away,
+            and refreshes it in the background. Callers only wait for a refresh once
+            the cached token has expired. Defaults to False.
+        :param session: (optional) The requests.Session to send all requests
+            through. By default the context creates its own, so that requests
+            to the same host reuse connections instead of paying for a new TCP
+            and TLS handshake each.
+        :param pool_size: (optional) The most connections per host the session
+            created by the context keeps open. Defaults to 10.
+        :param keep_alive: (optional) Set it to False for the session created
+            by the context to close each connection after its request.
+        :param HttpTransport transport: (optional) Sends all HTTP requests, in
+            place of the requests library. session, pool_size and keep_alive
+            are ignored when it is given.
+        :param RetryPolicy retry_policy: (optional) Retries requests which
+            were throttled or failed on the server side. By default nothing is
+            retried.
+        :param CircuitBreaker circuit_breaker: (optional) Fails requests fast
+            to hosts which keep failing, instead of waiting on each. Share one
+            among contexts to share what it learns about hosts.
+        :param float deadline: (optional) Seconds each acquisition may take,
+            with all its requests, from instance discovery to the token
+            request, and its retries. Every request has its timeout cut to
+            the time left, and none is sent once it is up. Device code
+            polling, which waits for the user, is only bounded by timeout.
         '''
         warnings.warn(
             """ADAL Python library no longer receives any feature update or bugfix.
@@ -124,7 +159,14 @@ https://learn.microsoft.com/en-us/azure/active-directory/develop/migrate-python-
             'proxies':proxies,
             'timeout':timeout,
             "enable_pii": enable_pii,
+            'stale_while_revalidate': stale_while_revalidate,
+            'transport': transport or RequestsTransport(
+                session or create_session(pool_size, keep_alive)),
+            'retry_policy': retry_policy,
+            'circuit_breaker': circuit_breaker,
             }
+        self._owns_transport = transport is None and session is None
+        self._deadline = deadline
         self._token_requests_with_user_code = {}
         self.cache = cache or TokenCache()
         self._lock = threading.RLock()
@@ -137,11 +179,27 @@ https://learn.microsoft.com/en-us/azure/active-directory/develop/migrate-python-
     def options(self, val):
         self._call_context['options'] = val
 
+    def close(self):
+        '''Closes the connections of the session the context created, if it
+        was not given a session or a transport.'''
+        if self._owns_transport:
+            self._call_context['transport'].close()
+
+    def _create_call_context(self, correlation_id=None):
+        # Each call gets its own copy, so that concurrent calls sharing this
+        # context do not overwrite each other's log context
+        started = _now()
+        return dict(
+            self._call_context, started=started,
+            deadline=started + self._deadline if self._deadline is not None else None,
+            log_context=log.create_log_context(
+                correlation_id or self.correlation_id,
+                self._call_context.get('enable_pii', False)))
+
     def _acquire_token(self, token_func, correlation_id=None):
-        self._call_context['log_context'] = log.create_log_context(
-            correlation_id or self.correlation_id, self._call_context.get('enable_pii', False))
-        self.authority.validate(self._call_context)
-        return token_func(self)
+        call_context = self._create_call_context(correlation_id)
+        self.authority.validate(call_context)
+        return token_func(self, call_context)
 
     def acquire_token(self, resource, user_id, client_id):
         '''Gets a token for a given resource via cached tokens.
@@ -154,8 +212,16 @@ https://learn.microsoft.com/en-us/azure/active-directory/develop/migrate-python-
         :returns: dic with several keys, include "accessToken" and
             "refreshToken".
         '''
-        def token_func(self):
-            token_request = TokenRequest(self._call_context, self, client_id, resource)
+        # A cache hit needs neither a log context nor the request machinery,
+        # once instance discovery is out of the way
+        if self.authority.validated:
+            entry = find_unexpired_entry(
+                self.cache, self.authority.url, resource, client_id, user_id)
+            if entry is not None:
+                return entry
+
+        def token_func(self, call_context):
+            token_request = TokenRequest(call_context, self, client_id, resource)
             return token_request.get_token_from_cache_with_refresh(user_id)
 
         return self._acquire_token(token_func)       
@@ -173,8 +239,8 @@ https://learn.microsoft.com/en-us/azure/active-directory/develop/migrate-python-
         :returns: dict with several keys, include "accessToken" and
             "refreshToken".
         '''
-        def token_func(self):
-            token_request = TokenRequest(self._call_context, self, client_id, resource)
+        def token_func(self, call_context):
+            token_request = TokenRequest(call_context, self, client_id, resource)
             return token_request.get_token_with_username_password(username, password)
 
         return self._acquire_token(token_func)
@@ -188,12 +254,95 @@ https://learn.microsoft.com/en-us/azure/active-directory/develop/migrate-python-
         :param str client_secret: The OAuth client secret of the calling application.
         :returns: dict with several keys, include "accessToken".
         '''
-        def token_func(self):
-            token_request = TokenRequest(self._call_context, self, client_id, resource)
+        def token_func(self, call_context):
+            token_request = TokenRequest(call_context, self, client_id, resource)
             return token_request.get_token_with_client_credentials(client_secret)
 
         return self._acquire_token(token_func)
 
+    def acquire_tokens(self, resources, user_id, client_id, max_workers=8):
+        '''Gets tokens for several resources via cached tokens.
+
+        Tokens which are cached and unexpired are returned right away. The
+        others are refreshed concurrently, on up to max_workers threads.
+
+        :param list resources: URIs that identify the resources for which
+            tokens are wanted.
+        :param str user_id: The username of the user on behalf this application
+            is authenticating.
+        :param str client_id: The OAuth client id of the calling application.
+        :param int max_workers: (optional) The most tokens to refresh at once.
+        :returns: dict mapping each resource to either the dict acquire_token
+            would return for it, or the exception it would raise.
+        '''
+        def create_token_func(resource):
+            def token_func(self, call_context):
+                token_request = TokenRequest(call_context, self, client_id, resource)
+                return token_request.get_token_from_cache_with_refresh(user_id)
+            return token_func
+
+        return self._acquire_tokens(
+            resources, user_id, client_id, create_token_func, max_workers)
+
+    def acquire_tokens_with_client_credentials(self, resources, client_id, client_secret,
+                                               max_workers=8):
+        '''Gets tokens for several resources via client credentials.
+
+        Tokens which are cached and unexpired are returned right away. The
+        others are requested concurrently, on up to max_workers threads.
+
+        :param list resources: URIs that identify the resources for which
+            tokens are wanted.
+        :param str client_id: The OAuth client id of the calling application.
+        :param str client_secret: The OAuth client secret of the calling application.
+        :param int max_workers: (optional) The most tokens to request at once.
+        :returns: dict mapping each resource to either the dict
+            acquire_token_with_client_credentials would return for it, or the
+            exception it would raise.
+        '''
+        def create_token_func(resource):
+            def token_func(self, call_context):
+                token_request = TokenRequest(call_context, self, client_id, resource)
+                return token_request.get_token_with_client_credentials(client_secret)
+            return token_func
+
+        return self._acquire_tokens(
+            resources, None, client_id, create_token_func, max_workers)
+
+    def _acquire_tokens(self, resources, user_id, client_id, create_token_func, max_workers):
+        results = {}
+        try:
+            self.authority.validate(self._create_call_context())
+        except Exception as exp: # pylint: disable=broad-except
+            for resource in resources:
+                results[resource] = exp
+            return results
+
+        misses = []
+        for resource in resources:
+            entry = find_unexpired_entry(
+                self.cache, self.authority.url, resource, client_id, user_id)
+            if entry is not None:
+                results[resource] = entry
+            elif resource not in misses:
+                misses.append(resource)
+        if not misses:
+            return results
+
+        def redeem(resource):
+            try:
+                return create_token_func(resource)(self, self._create_call_context())
+            except Exception as exp: # pylint: disable=broad-except
+                return exp
+
+        pool = ThreadPool(min(max_workers, len(misses)))
+        try:
+            results.update(zip(misses, pool.map(redeem, misses)))
+        finally:
+            pool.close()
+            pool.join()
+        return results
+
     def acquire_token_with_authorization_code(self, authorization_code, 
                                               redirect_uri, resource, 
                                               client_id, client_secret=None, code_verifier=None):
@@ -217,9 +366,9 @@ https://learn.microsoft.com/en-us/azure/active-directory/develop/migrate-python-
         :returns: dict with several keys, include "accessToken" and
             "refreshToken".
         '''
-        def token_func(self):
+        def token_func(self, call_context):
             token_request = TokenRequest(
-                self._call_context, 
+                call_context, 
                 self, 
                 client_id, 
                 resource, 
@@ -244,8 +393,8 @@ https://learn.microsoft.com/en-us/azure/active-directory/develop/migrate-python-
         :returns: dict with several keys, include "accessToken" and
             "refreshToken".
         '''
-        def token_func(self):
-            token_request = TokenRequest(self._call_context, self, client_id, resource)
+        def token_func(self, call_context):
+            token_request = TokenRequest(call_context, self, client_id, resource)
             return token_request.get_token_with_refresh_token(refresh_token, client_secret)
 
         return self._acquire_token(token_func)
@@ -276,8 +425,8 @@ https://learn.microsoft.com/en-us/azure/active-directory/develop/migrate-python-
 
         :returns: dict with several keys, include "accessToken".
         '''
-        def token_func(self):
-            token_request = TokenRequest(self._call_context, self, client_id, resource)
+        def token_func(self, call_context):
+            token_request = TokenRequest(call_context, self, client_id, resource)
             return token_request.get_token_with_certificate(certificate, thumbprint, public_certificate)
 
         return self._acquire_token(token_func)
@@ -293,10 +442,9 @@ https://learn.microsoft.com/en-us/azure/active-directory/develop/migrate-python-
             should be localized to.
         :returns: dict contains code and uri for users to login through browser.
         '''
-        self._call_context['log_context'] = log.create_log_context(
-            self.correlation_id, self._call_context.get('enable_pii', False))
-        self.authority.validate(self._call_context)
-        code_request = CodeRequest(self._call_context, self, client_id, resource)
+        call_context = self._create_call_context()
+        self.authority.validate(call_context)
+        code_request = CodeRequest(call_context, self, client_id, resource)
         return code_request.get_user_code_info(language)
 
     def acquire_token_with_device_code(self, resource, user_code_info, client_id):
@@ -310,8 +458,10 @@ https://learn.microsoft.com/en-us/azure/active-directory/develop/migrate-python-
         :returns: dict with several keys, include "accessToken" and
             "refreshToken".
         '''
-        def token_func(self):
-            token_request = TokenRequest(self._call_context, self, client_id, resource)
+        def token_func(self, call_context):
+            # Polling waits for the user; each poll is still bounded by timeout
+            call_context = dict(call_context, deadline=None)
+            token_request = TokenRequest(call_context, self, client_id, resource)
 
             key = user_code_info[OAuth2DeviceCodeResponseParameters.DEVICE_CODE]
             with self._lock:
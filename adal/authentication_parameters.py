@@ -29,8 +29,7 @@
 
 import re
 
-import requests
-
+from . import http_transport
 from . import util
 from . import log
 
@@ -149,7 +148,7 @@ def validate_url_object(url):
     if not url or not hasattr(url, 'geturl'):
         raise AttributeError('Parameter is of wrong type: url')
 
-def create_authentication_parameters_from_url(url, correlation_id=None):
+def create_authentication_parameters_from_url(url, correlation_id=None, transport=None):
 
     if isinstance(url, str):
         challenge_url = url
@@ -165,14 +164,13 @@ def create_authentication_parameters_from_url(url, correlation_id=None):
     )
 
     class _options(object):
-        _call_context = {'log_context': log_context}
+        _call_context = {'log_context': log_context, 'transport': transport}
 
     options = util.create_request_options(_options())
-    try:
-        response = requests.get(challenge_url, headers=options['headers'])
-    except Exception:
-        logger.info("Authentication parameters http get failed.")
-        raise
+    # The response is read as a challenge whatever its status
+    response = http_transport.send(
+        _options._call_context, logger, 'Authentication Parameters', 'GET', challenge_url,
+        options['headers'], check_status=False)
 
     try:
         return create_authentication_parameters_from_response(response)
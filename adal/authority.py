@@ -25,16 +25,18 @@
 #
 #------------------------------------------------------------------------------
 
+import threading
+
 try:
     from urllib.parse import quote, urlparse
 except ImportError:
     from urllib import quote # pylint: disable=no-name-in-module
     from urlparse import urlparse # pylint: disable=import-error,ungrouped-imports
 
-import requests
-
 from .constants import AADConstants
 from .adal_error import AdalError
+from . import http_transport
+from .instance_discovery_cache import get_instance_discovery_cache
 from . import log
 from . import util
 
@@ -44,6 +46,7 @@ class Authority(object):
 
         self._log = None
         self._call_context = None
+        self._lock = threading.Lock()
         self._url = urlparse(authority_url)
 
         self._validate_authority_url()
@@ -62,6 +65,11 @@ class Authority(object):
     def url(self):
         return self._url.geturl()
 
+    @property
+    def validated(self):
+        '''Whether instance discovery has completed, or is turned off.'''
+        return self._validated
+
     def _whitelisted(self): # testing if self._url.hostname is a dsts whitelisted domain
         # Add dSTS domains to whitelist based on based on domain
         # https://microsoft.sharepoint.com/teams/AzureSecurityCompliance/Security/SitePages/dSTS%20Fundamentals.aspx
@@ -132,43 +140,30 @@ class Authority(object):
         self._log.debug("Attempting instance discover at: %(discovery_endpoint)s",
                         {"discovery_endpoint": discovery_endpoint.geturl()})
 
-        try:
-            resp = requests.get(discovery_endpoint.geturl(), headers=get_options['headers'],
-                                verify=self._call_context.get('verify_ssl', None),
-                                proxies=self._call_context.get('proxies', None))
-            util.log_return_correlation_id(self._log, operation, resp)
-        except Exception:
-            self._log.exception("%(operation)s request failed",
-                                {"operation": operation})
-            raise
-
-        if resp.status_code == 429:
-            resp.raise_for_status()  # Will raise requests.exceptions.HTTPError
-        if not util.is_http_success(resp.status_code):
-            return_error_string = u"{} request returned http error: {}".format(operation,
-                                                                               resp.status_code)
-            error_response = ""
-            if resp.text:
-                return_error_string = u"{} and server response: {}".format(return_error_string,
-                                                                           resp.text)
-                try:
-                    error_response = resp.json()
-                except ValueError:
-                    pass
-
-            raise AdalError(return_error_string, error_response)
+        resp = http_transport.send(self._call_context, self._log, operation, 'GET',
+                                   discovery_endpoint.geturl(), get_options['headers'])
+        return self._parse_instance_discovery_response(resp)
 
+    @staticmethod
+    def _parse_instance_discovery_response(resp):
+        discovery_resp = resp.json()
+        if discovery_resp.get('tenant_discovery_endpoint'):
+            return discovery_resp['tenant_discovery_endpoint']
         else:
-            discovery_resp = resp.json()
-            if discovery_resp.get('tenant_discovery_endpoint'):
-                return discovery_resp['tenant_discovery_endpoint']
-            else:
-                raise AdalError('Failed to parse instance discovery response')
+            raise AdalError('Failed to parse instance discovery response')
+
+    def _perform_cached_instance_discovery(self):
+        if get_instance_discovery_cache().get(self._host, self._tenant) is None:
+            return False
+        self._log.debug("Authority validated via the instance discovery cache")
+        return True
 
     def _validate_via_instance_discovery(self):
-        valid = self._perform_static_instance_discovery()
+        valid = self._perform_static_instance_discovery() or \
+            self._perform_cached_instance_discovery()
         if not valid:
-            self._perform_dynamic_instance_discovery()
+            tenant_discovery_endpoint = self._perform_dynamic_instance_discovery()
+            get_instance_discovery_cache().add(self._host, self._tenant, tenant_discovery_endpoint)
 
     def _get_oauth_endpoints(self):
 
@@ -177,18 +172,20 @@ class Authority(object):
             self.device_code_endpoint = self._url.geturl() + AADConstants.DEVICE_ENDPOINT_PATH
 
     def validate(self, call_context):
+        # The lock keeps concurrent callers from swapping the call context
+        # and logger out from under an instance discovery in progress
+        with self._lock:
+            self._log = log.Logger('Authority', call_context['log_context'])
+            self._call_context = call_context
+
+            if not self._validated:
+                self._log.debug("Performing instance discovery: %(authority)s",
+                                {"authority": self._url.geturl()})
+                self._validate_via_instance_discovery()
+                self._validated = True
+            else:
+                self._log.debug(
+                    "Instance discovery/validation has either already been completed or is turned off: %(authority)s",
+                    {"authority": self._url.geturl()})
 
-        self._log = log.Logger('Authority', call_context['log_context'])
-        self._call_context = call_context
-
-        if not self._validated:
-            self._log.debug("Performing instance discovery: %(authority)s",
-                            {"authority": self._url.geturl()})
-            self._validate_via_instance_discovery()
-            self._validated = True
-        else:
-            self._log.debug(
-                "Instance discovery/validation has either already been completed or is turned off: %(authority)s",
-                {"authority": self._url.geturl()})
-
-        self._get_oauth_endpoints()
+            self._get_oauth_endpoints()
@@ -26,13 +26,15 @@
 #------------------------------------------------------------------------------
 
 import base64
-import copy
+from collections import OrderedDict
 import hashlib
-from datetime import datetime, timedelta
-from dateutil import parser
+import threading
+import time
 
 from .adal_error import AdalError
 from .constants import TokenResponseFields, Misc
+from .token_cache import (TokenCacheKey, TokenEntry, _get_cache_key, _get_expires_on_timestamp,
+                          _with_refresh_token)
 from . import log
 
 #surppress warnings: like access to a protected member of "_AUTHORITY", etc
@@ -43,14 +45,20 @@ def _create_token_hash(token):
     hash_object.update(token.encode('utf8'))
     return base64.b64encode(hash_object.digest())
 
-def _create_token_id_message(entry):
-    access_token_hash = _create_token_hash(entry[TokenResponseFields.ACCESS_TOKEN])
-    message = 'AccessTokenId: ' + str(access_token_hash)
-    if entry.get(TokenResponseFields.REFRESH_TOKEN):
-        refresh_token_hash = _create_token_hash(entry[TokenResponseFields.REFRESH_TOKEN])
-        message += ', RefreshTokenId: ' + str(refresh_token_hash)
-    return message
+class _TokenIdMessage(object): # pylint: disable=too-few-public-methods
+    '''Log argument identifying the tokens of an entry by their hashes. The
+    hashes are only computed if the message is formatted.'''
+    __slots__ = ('_access_token', '_refresh_token')
 
+    def __init__(self, entry):
+        self._access_token = entry[TokenResponseFields.ACCESS_TOKEN]
+        self._refresh_token = entry.get(TokenResponseFields.REFRESH_TOKEN)
+
+    def __str__(self):
+        message = 'AccessTokenId: ' + str(_create_token_hash(self._access_token))
+        if self._refresh_token:
+            message += ', RefreshTokenId: ' + str(_create_token_hash(self._refresh_token))
+        return message
 def _is_mrrt(entry):
     return bool(entry.get(TokenResponseFields.RESOURCE, None))
 
@@ -59,6 +67,108 @@ def _entry_has_metadata(entry):
             TokenResponseFields._AUTHORITY in entry)
 
 
+class _Flight(object): # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+# Refreshes in progress, by cache and by the key of the entry they produce
+_flights = {}
+_flights_lock = threading.Lock()
+
+# Seconds during which a refresh token AAD rejected with invalid_grant is not
+# sent again for the same cache entry; the rejection is raised instead
+INVALID_GRANT_CACHE_TTL = 60
+_INVALID_GRANT_CACHE_SIZE = 1000
+
+# (expires at, AdalError) by (cache key, refresh token hash), oldest first
+_invalid_grants = OrderedDict()
+
+def _is_invalid_grant(error):
+    response = error.error_response
+    return isinstance(response, dict) and response.get('error') == 'invalid_grant'
+
+def _get_invalid_grant(failure_key):
+    with _flights_lock:
+        item = _invalid_grants.get(failure_key)
+        if item is None:
+            return None
+        if item[0] <= time.time():
+            del _invalid_grants[failure_key]
+            return None
+        return item[1]
+
+def _remember_invalid_grant(failure_key, error):
+    with _flights_lock:
+        _invalid_grants.pop(failure_key, None)
+        _invalid_grants[failure_key] = (time.time() + INVALID_GRANT_CACHE_TTL, error)
+        while len(_invalid_grants) > _INVALID_GRANT_CACHE_SIZE:
+            _invalid_grants.popitem(last=False)
+
+# Seconds to wait after a failed background refresh before trying again
+BACKGROUND_REFRESH_RETRY_DELAY = 30
+
+# When a background refresh may next start, by cache and entry key, oldest
+# first. A refresh in progress is there until it completes, a failed one
+# until its retry delay has passed and it is next looked up, and at most
+# _BACKGROUND_REFRESH_CACHE_SIZE of them are kept.
+_BACKGROUND_REFRESH_CACHE_SIZE = 1000
+_background_refreshes = OrderedDict()
+
+def _single_flight(key, func):
+    '''Run func, unless a call with the same key is already running, in which
+    case wait for it and share its result or its exception.'''
+    with _flights_lock:
+        flight = _flights.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _flights[key] = _Flight()
+
+    if not is_leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = func()
+        return flight.result
+    except Exception as exp:
+        flight.error = exp
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def find_unexpired_entry(cache, authority, resource, client_id, user_id):
+    '''Look up the cache entry issued by this authority for exactly this
+    resource, client and user, on the fast path of a cache hit.
+
+    :returns: the entry if it is the only match and its access token is not
+        about to expire, otherwise None. The full CacheDriver lookup handles
+        every such case: refreshes, MRRT redemption and ambiguous matches.
+    '''
+    query = {TokenResponseFields._CLIENT_ID: client_id}
+    if user_id:
+        query[TokenResponseFields.USER_ID] = user_id
+    found = None
+    for entry in cache.find(query):
+        if entry.get(TokenResponseFields.RESOURCE) == resource and \
+                entry.get(TokenResponseFields._AUTHORITY) == authority:
+            if found is not None:
+                return None
+            found = entry
+    if found is None:
+        return None
+    expiry = _get_expires_on_timestamp(found)
+    if expiry is None or expiry < time.time() + Misc.CLOCK_BUFFER * 60:
+        return None
+    return found
+
+
 class CacheDriver(object):
     def __init__(self, call_context, authority, resource, client_id, cache,
                  refresh_function):
@@ -87,13 +197,6 @@ class CacheDriver(object):
             'Found %(quantity)s potential entries.', {"quantity": len(entries)})
         return entries
     
-    def _find_mrrt_tokens_for_user(self, user):
-        return self._cache.find({
-            TokenResponseFields.IS_MRRT: True,
-            TokenResponseFields.USER_ID: user,
-            TokenResponseFields._CLIENT_ID : self._client_id            
-            })
-
     def _load_single_entry_from_cache(self, query):
         return_val = []
         is_resource_tenant_specific = False
@@ -125,12 +228,13 @@ class CacheDriver(object):
 
         if return_val:
             self._log.debug('Returning token from cache lookup, %(token_hash)s',
-                            {"token_hash": _create_token_id_message(return_val)})
+                            {"token_hash": _TokenIdMessage(return_val)})
 
         return return_val, is_resource_tenant_specific
 
     def _create_entry_from_refresh(self, entry, refresh_response):
-        new_entry = copy.deepcopy(entry)
+        # The values are strings and flags, so a shallow copy is enough
+        new_entry = TokenEntry(entry)
         new_entry.update(refresh_response)
 
         # It is possible the response payload has no 'resource' field, like in ADFS, so we manually 
@@ -146,34 +250,129 @@ class CacheDriver(object):
         return new_entry
 
     def _replace_entry(self, entry_to_replace, new_entry):
-        self.remove(entry_to_replace)
-        self.add(new_entry)
+        self._log.debug('Replacing entry %(token_hash)s',
+                        {"token_hash": _TokenIdMessage(new_entry)})
+        self._store(new_entry, [entry_to_replace])
+
+    def _find_refreshed_entry(self, key, stale_entry):
+        # Another caller may have completed the refresh since the stale entry
+        # was read, in which case the cache already holds its result.
+        for entry in self._cache.find({
+                TokenResponseFields._CLIENT_ID: key.client_id,
+                TokenResponseFields.USER_ID: key.user_id}):
+            if _get_cache_key(entry) == key and not self._is_expiring(entry):
+                if stale_entry is None or \
+                        entry.get(TokenResponseFields.ACCESS_TOKEN) != \
+                        stale_entry.get(TokenResponseFields.ACCESS_TOKEN):
+                    return entry
+        return None
+
+    def _check_invalid_grant(self, key, entry):
+        '''Raise the invalid_grant error the refresh token of entry met
+        recently, if any, and return the key to remember a new one under.'''
+        failure_key = (key, _create_token_hash(entry.get(TokenResponseFields.REFRESH_TOKEN) or ''))
+        error = _get_invalid_grant(failure_key)
+        if error is not None:
+            self._log.info('The refresh token was rejected with invalid_grant recently. '
+                           'Raising that error again instead of sending it.')
+            error.__traceback__ = None # or each raise would extend it
+            raise error
+        return failure_key
+
+    def _redeem_refresh_token(self, key, entry, resource):
+        failure_key = self._check_invalid_grant(key, entry)
+        try:
+            return self._refresh_function(entry, resource)
+        except AdalError as exp:
+            if _is_invalid_grant(exp):
+                _remember_invalid_grant(failure_key, exp)
+            raise
 
     def _refresh_expired_entry(self, entry):
-        token_response = self._refresh_function(entry, None)
-        new_entry = self._create_entry_from_refresh(entry, token_response)
-        self._replace_entry(entry, new_entry)
-        self._log.info('Returning token refreshed after expiry.')
-        return new_entry
+        key = _get_cache_key(entry)
+
+        def refresh():
+            refreshed_entry = self._find_refreshed_entry(key, entry)
+            if refreshed_entry:
+                self._log.info('Returning token refreshed by another caller.')
+                return refreshed_entry
+            token_response = self._redeem_refresh_token(key, entry, None)
+            new_entry = self._create_entry_from_refresh(entry, token_response)
+            self._replace_entry(entry, new_entry)
+            self._log.info('Returning token refreshed after expiry.')
+            return new_entry
+
+        return _single_flight((id(self._cache), key), refresh)
 
     def _acquire_new_token_from_mrrt(self, entry):
-        token_response = self._refresh_function(entry, self._resource)
-        new_entry = self._create_entry_from_refresh(entry, token_response)
-        self.add(new_entry)
-        self._log.info('Returning token derived from mrrt refresh.')
-        return new_entry
+        key = TokenCacheKey(
+            self._authority, self._resource,
+            entry.get(TokenResponseFields._CLIENT_ID), entry.get(TokenResponseFields.USER_ID))
+
+        def acquire():
+            acquired_entry = self._find_refreshed_entry(key, None)
+            if acquired_entry:
+                self._log.info('Returning token derived from mrrt by another caller.')
+                return acquired_entry
+            token_response = self._redeem_refresh_token(key, entry, self._resource)
+            new_entry = self._create_entry_from_refresh(entry, token_response)
+            self.add(new_entry)
+            self._log.info('Returning token derived from mrrt refresh.')
+            return new_entry
+
+        return _single_flight((id(self._cache), key), acquire)
+
+    @staticmethod
+    def _is_expiring(entry, buffer_seconds=Misc.CLOCK_BUFFER * 60):
+        expiry = _get_expires_on_timestamp(entry)
+        if expiry is None:
+            raise AdalError('The cached token has no valid expiresOn.')
 
-    def _refresh_entry_if_necessary(self, entry, is_resource_specific):
-        expiry_date = parser.parse(entry[TokenResponseFields.EXPIRES_ON])
-        now = datetime.now(expiry_date.tzinfo)
-            
         # Add some buffer in to the time comparison to account for clock skew or latency.
-        now_plus_buffer = now + timedelta(minutes=Misc.CLOCK_BUFFER)
+        now_plus_buffer = time.time() + buffer_seconds
+        return now_plus_buffer > expiry
+
+    def _refresh_in_background(self, entry):
+        key = (id(self._cache), _get_cache_key(entry))
+        with _flights_lock:
+            retry_after = _background_refreshes.pop(key, 0)
+            if retry_after > time.time():
+                _background_refreshes[key] = retry_after
+                return
+            _background_refreshes[key] = float('inf')
+            while len(_background_refreshes) > _BACKGROUND_REFRESH_CACHE_SIZE:
+                _background_refreshes.popitem(last=False)
+
+        def refresh():
+            retry_after = 0
+            try:
+                self._refresh_expired_entry(entry)
+            except Exception: # pylint: disable=broad-except
+                self._log.exception('Refreshing the cached token in the background failed')
+                retry_after = time.time() + BACKGROUND_REFRESH_RETRY_DELAY
+            finally:
+                with _flights_lock:
+                    _background_refreshes.pop(key, None)
+                    if retry_after:
+                        _background_refreshes[key] = retry_after
+                        while len(_background_refreshes) > _BACKGROUND_REFRESH_CACHE_SIZE:
+                            _background_refreshes.popitem(last=False)
+
+        self._log.info('Cached token expires at %(date)s.  Refreshing in the background',
+                       {"date": entry[TokenResponseFields.EXPIRES_ON]})
+        thread = threading.Thread(target=refresh, name='adal-background-refresh')
+        thread.daemon = True
+        thread.start()
 
-        if is_resource_specific and now_plus_buffer > expiry_date:
+    def _refresh_entry_if_necessary(self, entry, is_resource_specific):
+        if is_resource_specific and self._is_expiring(entry):
             if TokenResponseFields.REFRESH_TOKEN in entry:
+                if self._call_context.get('stale_while_revalidate') and \
+                        not self._is_expiring(entry, buffer_seconds=0):
+                    self._refresh_in_background(entry)
+                    return entry
                 self._log.info('Cached token is expired at %(date)s.  Refreshing',
-                               {"date": expiry_date})
+                               {"date": entry[TokenResponseFields.EXPIRES_ON]})
                 return self._refresh_expired_entry(entry)
             else:
                 self.remove(entry)
@@ -204,26 +403,41 @@ class CacheDriver(object):
         self._log.debug('Removing entry.')
         self._cache.remove([entry])
 
-    def _remove_many(self, entries):
-        self._log.debug('Remove many: %(number)s', {"number": len(entries)})
-        self._cache.remove(entries)
-
-    def _add_many(self, entries):
-        self._log.debug('Add many: %(number)s', {"number": len(entries)})
-        self._cache.add(entries)
-
-    def _update_refresh_tokens(self, entry):
-        if _is_mrrt(entry) and entry.get(TokenResponseFields.REFRESH_TOKEN):
-            mrrt_tokens = self._find_mrrt_tokens_for_user(entry.get(TokenResponseFields.USER_ID))
-            if mrrt_tokens:
-                self._log.debug('Updating %(number)s cached refresh tokens',
-                                {"number": len(mrrt_tokens)})
-                self._remove_many(mrrt_tokens)
-               
-                for t in mrrt_tokens:
-                    t[TokenResponseFields.REFRESH_TOKEN] = entry[TokenResponseFields.REFRESH_TOKEN]
+    def _replace_many(self, entries_to_remove, entries_to_add):
+        self._log.debug('Replace many: %(removed)s removed, %(added)s added',
+                        {"removed": len(entries_to_remove), "added": len(entries_to_add)})
+        replace = getattr(self._cache, 'replace', None)
+        if replace is None: # A custom cache, which predates TokenCache.replace
+            if entries_to_remove:
+                self._cache.remove(entries_to_remove)
+            self._cache.add(entries_to_add)
+        else:
+            replace(entries_to_remove, entries_to_add)
 
-                self._add_many(mrrt_tokens)
+    def _store(self, entry, entries_to_remove):
+        '''Replace entries_to_remove with entry, and give the refresh token
+        of entry to the other cached MRRT entries of the user, as one change
+        where the cache supports it.'''
+        self._argument_entry_with_cached_metadata(entry)
+        refresh_token = entry.get(TokenResponseFields.REFRESH_TOKEN) if _is_mrrt(entry) else None
+        if not refresh_token:
+            self._replace_many(entries_to_remove, [entry])
+            return
+        query = {
+            TokenResponseFields.IS_MRRT: True,
+            TokenResponseFields.USER_ID: entry.get(TokenResponseFields.USER_ID),
+            TokenResponseFields._CLIENT_ID: self._client_id,
+            }
+        update_refresh_tokens = getattr(self._cache, 'update_refresh_tokens', None)
+        if update_refresh_tokens is not None:
+            updated = update_refresh_tokens(query, refresh_token, entries_to_remove, [entry])
+        else: # A custom cache, which predates TokenCache.update_refresh_tokens
+            updated = _with_refresh_token(
+                self._cache.find(query), refresh_token, entries_to_remove + [entry])
+            self._replace_many(entries_to_remove, updated + [entry])
+        if updated:
+            self._log.debug('Updated %(number)s cached refresh tokens',
+                            {"number": len(updated)})
 
     def _argument_entry_with_cached_metadata(self, entry):
         if _entry_has_metadata(entry):
@@ -240,7 +454,5 @@ class CacheDriver(object):
 
     def add(self, entry):
         self._log.debug('Adding entry %(token_hash)s',
-                        {"token_hash": _create_token_id_message(entry)})
-        self._argument_entry_with_cached_metadata(entry)
-        self._update_refresh_tokens(entry)
-        self._cache.add([entry])
+                        {"token_hash": _TokenIdMessage(entry)})
+        self._store(entry, [])
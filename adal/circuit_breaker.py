@@ -0,0 +1,126 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+import threading
+
+from .adal_error import AdalError
+from .retry_policy import _now
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class _Circuit(object):
+    def __init__(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_started = None
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+
+
+class CircuitBreaker(object):
+    '''Fails requests to a host fast while the host is failing, instead of
+    letting each of them wait for its own timeout.
+
+    After failure_threshold consecutive failed requests to a host, its
+    circuit opens and requests to it raise an AdalError without being sent.
+    Once reset_timeout seconds have passed, one request is let through as a
+    probe: the circuit closes if it succeeds, and opens for another
+    reset_timeout if it fails. A request fails when it raises, or when the
+    server answers 429 or 5xx.
+
+    Hosts are told apart by the host and port of their URLs, so an ADFS
+    outage does not stop requests to Azure Active Directory. One breaker may
+    be shared by many contexts, and many threads.
+
+    :param int failure_threshold: (optional) Consecutive failures which open
+        a circuit. Defaults to 5.
+    :param float reset_timeout: (optional) Seconds a circuit stays open
+        before a probe is let through. Defaults to 30.
+    '''
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def before_request(self, host):
+        '''Raise an AdalError if requests to host must not be sent now.'''
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None:
+                circuit = self._circuits[host] = _Circuit()
+            if circuit.state != CLOSED:
+                now = _now()
+                if circuit.state == OPEN and now >= circuit.opened_at + self.reset_timeout:
+                    circuit.state = HALF_OPEN
+                    circuit.probe_started = now
+                # A probe which never reported back does not hold the circuit forever
+                elif circuit.state == HALF_OPEN and now >= circuit.probe_started + self.reset_timeout:
+                    circuit.probe_started = now
+                else:
+                    circuit.rejected += 1
+                    raise AdalError(
+                        "Requests to {} are failing fast: its circuit is {}".format(
+                            host, circuit.state))
+            circuit.requests += 1
+
+    def record(self, host, response=None, error=None):
+        '''Record how a request to host let through by before_request went.'''
+        failed = error is not None or response.status_code == 429 \
+            or response.status_code >= 500
+        with self._lock:
+            circuit = self._circuits.setdefault(host, _Circuit())
+            if not failed:
+                circuit.state = CLOSED
+                circuit.consecutive_failures = 0
+                circuit.opened_at = circuit.probe_started = None
+                return
+            circuit.failures += 1
+            circuit.consecutive_failures += 1
+            if circuit.state == HALF_OPEN \
+                    or circuit.consecutive_failures >= self.failure_threshold:
+                circuit.state = OPEN
+                circuit.opened_at = _now()
+                circuit.probe_started = None
+
+    def stats(self):
+        '''Return, by host, the state of its circuit and counts of its
+        requests: sent, failed, and rejected without being sent.'''
+        with self._lock:
+            return dict((host, {
+                'state': circuit.state,
+                'consecutive_failures': circuit.consecutive_failures,
+                'requests': circuit.requests,
+                'failures': circuit.failures,
+                'rejected': circuit.rejected,
+                }) for host, circuit in self._circuits.items())
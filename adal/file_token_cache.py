@@ -0,0 +1,146 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+import contextlib
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows
+    fcntl = None
+
+from .token_cache import TokenCache, _with_refresh_token
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class FileTokenCache(TokenCache):
+    '''Token cache persisted in a file, which processes on one machine share.
+
+    Every change is written to the file under an exclusive ``fcntl`` lock,
+    and the file is reloaded only when another process has rewritten it
+    since this instance last read it, so that a token one worker refreshed
+    is served to all the others. Lookups in between are answered from
+    memory. Where ``fcntl`` is not available, such as on Windows, the file
+    is still shared but writers are not coordinated.
+
+    :param str path: Path of the cache file. A companion ``<path>.lock``
+        file is created next to it.
+    '''
+
+    def __init__(self, path):
+        super(FileTokenCache, self).__init__()
+        self._path = path
+        self._lock_path = path + '.lock'
+        self._signature = None
+        with self._lock, self._file_lock(exclusive=False):
+            self._reload_if_changed()
+
+    def find(self, query):
+        with self._lock:
+            if self._get_file_signature() != self._signature:
+                with self._file_lock(exclusive=False):
+                    self._reload_if_changed()
+            return super(FileTokenCache, self).find(query)
+
+    def remove(self, entries):
+        with self._lock, self._file_lock(exclusive=True):
+            self._reload_if_changed()
+            super(FileTokenCache, self).remove(entries)
+            self._write_if_changed()
+
+    def add(self, entries):
+        with self._lock, self._file_lock(exclusive=True):
+            self._reload_if_changed()
+            super(FileTokenCache, self).add(entries)
+            self._write_if_changed()
+
+    def replace(self, entries_to_remove, entries_to_add):
+        with self._lock, self._file_lock(exclusive=True):
+            self._reload_if_changed()
+            super(FileTokenCache, self).remove(entries_to_remove)
+            super(FileTokenCache, self).add(entries_to_add)
+            self._write_if_changed()
+
+    def update_refresh_tokens(self, query, refresh_token, entries_to_remove, entries_to_add):
+        # Read and write under one exclusive file lock, so that no other
+        # process rotates the entries in between
+        with self._lock, self._file_lock(exclusive=True):
+            self._reload_if_changed()
+            updated = _with_refresh_token(super(FileTokenCache, self).find(query),
+                                          refresh_token, entries_to_remove + entries_to_add)
+            super(FileTokenCache, self).remove(entries_to_remove)
+            super(FileTokenCache, self).add(updated + entries_to_add)
+            self._write_if_changed()
+            return updated
+
+    def _get_file_signature(self):
+        # Every write replaces the file, so the inode changes even when two
+        # writes happen within the resolution of the modification time.
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, getattr(stat, 'st_mtime_ns', stat.st_mtime))
+
+    @contextlib.contextmanager
+    def _file_lock(self, exclusive):
+        with open(self._lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _reload_if_changed(self):
+        signature = self._get_file_signature()
+        if signature == self._signature:
+            return
+        state = None
+        if signature is not None:
+            with open(self._path, 'r') as cache_file:
+                state = cache_file.read()
+        self.deserialize(state)
+        self._signature = signature
+
+    def _write_if_changed(self):
+        if not self.has_state_changed:
+            return
+        directory = os.path.dirname(os.path.abspath(self._path))
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.adal-cache-')
+        try:
+            with os.fdopen(handle, 'w') as temp_file:
+                temp_file.write(self.serialize())
+            _replace(temp_path, self._path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        self._signature = self._get_file_signature()
+        self.has_state_changed = False
@@ -0,0 +1,210 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+try:
+    from http.cookiejar import DefaultCookiePolicy
+except ImportError:
+    from cookielib import DefaultCookiePolicy #pylint: disable=import-error
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse #pylint: disable=import-error
+
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .adal_error import AdalError
+from .retry_policy import _now
+from . import util
+
+_ERROR_TEMPLATE = u"{} request returned http error: {}"
+
+
+class HttpTransport(object):
+    '''Sends the HTTP requests of ADAL.
+
+    Every request of an AuthenticationContext goes through its transport. A
+    subclass can send them with another HTTP client, answer them in process
+    for load tests, or time them.
+    '''
+
+    def send(self, method, url, headers=None, data=None, timeout=None, verify=None,
+             proxies=None):
+        '''Send a request and return its response.
+
+        The parameters mean what they mean for requests.request. The response
+        needs the status_code, headers, text, json() and raise_for_status()
+        of a requests.Response.
+        '''
+        raise NotImplementedError()
+
+    def close(self):
+        '''Release the connections of the transport, if it keeps any.'''
+        pass
+
+
+def create_session(pool_size=10, keep_alive=True):
+    '''Create a requests.Session which keeps up to pool_size connections to
+    each host open for reuse, unless keep_alive is False.'''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    # Requests sent without a session never carried cookies; keep it that way
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+class RequestsTransport(HttpTransport):
+    '''Sends requests with the requests library, through session if there is
+    one, or else on a new connection each.'''
+
+    def __init__(self, session=None):
+        self.session = session
+
+    def send(self, method, url, headers=None, data=None, timeout=None, verify=None,
+             proxies=None):
+        return (self.session or requests).request(
+            method, url, headers=headers, data=data, timeout=timeout, verify=verify,
+            proxies=proxies)
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+_default_transport = RequestsTransport()
+
+
+def check_response(operation, resp):
+    '''Raise the error ADAL reports for an unsuccessful response.'''
+    if resp.status_code == 429:
+        resp.raise_for_status()  # Will raise requests.exceptions.HTTPError
+    if not util.is_http_success(resp.status_code):
+        return_error_string = _ERROR_TEMPLATE.format(operation, resp.status_code)
+        error_response = ""
+        if resp.text:
+            return_error_string = u"{} and server response: {}".format(return_error_string,
+                                                                       resp.text)
+            try:
+                error_response = resp.json()
+            except ValueError:
+                pass
+        raise AdalError(return_error_string, error_response)
+
+
+def send(call_context, logger, operation, method, url, headers=None, data=None,
+         check_status=True):
+    '''Send a request through the transport of call_context and return the
+    response, raising for unsuccessful ones unless check_status is False.
+
+    Throttled or failed requests are retried as the retry policy of
+    call_context, if it has one, allows, and requests to a host the circuit
+    breaker of call_context holds open fail fast. No request is sent, or
+    retried, past the deadline of call_context, and the timeout of each is
+    cut to the time left until it.
+    '''
+    transport = call_context.get('transport') or _default_transport
+    policy = call_context.get('retry_policy')
+    started = call_context.get('started') or _now()
+    deadline = call_context.get('deadline')
+    breaker = call_context.get('circuit_breaker')
+    host = urlparse(url).netloc.lower()
+    retries = 0
+    delay = 0
+    while True:
+        remaining = _remaining_time(call_context, logger, operation)
+        if breaker is not None:
+            breaker.before_request(host)
+        try:
+            resp = transport.send(
+                method, url, headers=headers, data=data,
+                timeout=_bounded_timeout(call_context.get('timeout', None), remaining),
+                verify=call_context.get('verify_ssl', None),
+                proxies=call_context.get('proxies', None))
+            util.log_return_correlation_id(logger, operation, resp)
+        except Exception as exp: # pylint: disable=broad-except
+            if breaker is not None:
+                breaker.record(host, error=exp)
+            delay = _retry_delay(policy, retries, delay, started, deadline, error=exp)
+            if delay is None:
+                logger.exception("%(operation)s request failed", {"operation": operation})
+                raise
+            logger.warn("%(operation)s request failed, retrying in %(delay).2f seconds",
+                        {"operation": operation, "delay": delay})
+        else:
+            if breaker is not None:
+                breaker.record(host, response=resp)
+            delay = _retry_delay(policy, retries, delay, started, deadline, response=resp)
+            if delay is None:
+                break
+            logger.warn("%(operation)s request returned http status %(status)s, "
+                        "retrying in %(delay).2f seconds",
+                        {"operation": operation, "status": resp.status_code, "delay": delay})
+        time.sleep(delay)
+        retries += 1
+    if check_status:
+        check_response(operation, resp)
+    return resp
+
+
+def _retry_delay(policy, retries, previous_delay, started, deadline=None, response=None,
+                 error=None):
+    if policy is None or not policy.is_retryable(response, error):
+        return None
+    delay = policy.next_delay(retries, previous_delay, started, response)
+    if delay is not None and deadline is not None and _now() + delay >= deadline:
+        return None
+    return delay
+
+
+def _remaining_time(call_context, logger, operation):
+    '''Return the seconds left until the deadline of call_context, or None
+    if it has none. Raise an AdalError once the deadline has passed.'''
+    deadline = call_context.get('deadline')
+    if deadline is None:
+        return None
+    remaining = deadline - _now()
+    if remaining <= 0:
+        logger.warn("%(operation)s request not sent: the deadline has passed",
+                    {"operation": operation})
+        raise AdalError(u"{} request not sent: the deadline of the acquisition has "
+                        u"passed".format(operation))
+    return remaining
+
+
+def _bounded_timeout(timeout, remaining):
+    '''Cut timeout, a float or a (connect, read) tuple, to remaining.'''
+    if remaining is None:
+        return timeout
+    if isinstance(timeout, tuple):
+        return tuple(remaining if part is None else min(part, remaining) for part in timeout)
+    return remaining if timeout is None else min(timeout, remaining)
@@ -0,0 +1,145 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from . import log
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class InstanceDiscoveryCache(object):
+    '''Remembers which authorities passed instance discovery, for every
+    AuthenticationContext of the process, so that each authority is
+    discovered once per ttl instead of once per context.
+
+    Entries are keyed by authority host and tenant. Only successful
+    discoveries are remembered. When a path is given, entries are also
+    written to that JSON file and read back by the next process using it,
+    so that a deployment discovers its authorities once. A file which
+    cannot be written is logged and otherwise ignored.
+
+    :param float ttl: (optional) Seconds an entry is used for. Defaults to
+        one day.
+    :param str path: (optional) File to persist entries to.
+    '''
+
+    def __init__(self, ttl=24 * 60 * 60, path=None):
+        self.ttl = ttl
+        self._path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._log = log.Logger('InstanceDiscoveryCache', log.create_log_context())
+        if path:
+            with self._lock:
+                self._entries = self._load()
+
+    @staticmethod
+    def _key(host, tenant):
+        return u'{}/{}'.format(host, tenant).lower()
+
+    def get(self, host, tenant):
+        '''Return the tenant discovery endpoint of an unexpired entry for the
+        authority, or None.'''
+        with self._lock:
+            entry = self._entries.get(self._key(host, tenant))
+            if entry is None or entry['expires_on'] <= time.time():
+                return None
+            return entry['tenant_discovery_endpoint']
+
+    def add(self, host, tenant, tenant_discovery_endpoint):
+        '''Remember that the authority passed instance discovery.'''
+        entry = {
+            'tenant_discovery_endpoint': tenant_discovery_endpoint,
+            'expires_on': time.time() + self.ttl,
+            }
+        with self._lock:
+            if self._path:
+                # Keep what other processes wrote in the meantime
+                self._entries.update(self._load())
+            self._entries[self._key(host, tenant)] = entry
+            if self._path:
+                self._write()
+
+    def clear(self):
+        '''Forget every entry, including those in the file.'''
+        with self._lock:
+            self._entries = {}
+            if self._path:
+                self._write()
+
+    def _load(self):
+        try:
+            with open(self._path, 'r') as cache_file:
+                entries = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return {}
+        now = time.time()
+        return dict((key, entry) for key, entry in entries.items()
+                    if isinstance(entry, dict) and 'tenant_discovery_endpoint' in entry
+                    and entry.get('expires_on', 0) > now)
+
+    def _write(self):
+        # Persisting is best effort: the entries in memory still serve this
+        # process when the file cannot be written
+        temp_path = None
+        try:
+            directory = os.path.dirname(os.path.abspath(self._path))
+            handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.adal-discovery-')
+            with os.fdopen(handle, 'w') as temp_file:
+                json.dump(self._entries, temp_file)
+            _replace(temp_path, self._path)
+        except (IOError, OSError) as exp:
+            self._log.warn("Could not write the instance discovery cache to %(path)s: %(error)s",
+                           {"path": self._path, "error": exp})
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+_cache = InstanceDiscoveryCache()
+
+
+def set_instance_discovery_cache(cache):
+    '''Replace the InstanceDiscoveryCache every AuthenticationContext of the
+    process uses, for instance with one persisted to a file.
+
+    Basic Usages::
+        >>>adal.set_instance_discovery_cache(
+        >>>    adal.InstanceDiscoveryCache(path='/var/cache/app/adal-discovery.json'))
+    '''
+    global _cache # pylint: disable=global-statement
+    _cache = cache
+
+
+def get_instance_discovery_cache():
+    '''Return the InstanceDiscoveryCache every AuthenticationContext of the
+    process uses.'''
+    return _cache
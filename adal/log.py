@@ -100,6 +100,8 @@ class Logger(object):
         is to use the `warn("hello %(name)s", {"name": "John Doe"}` form,
         so that this method will scrub pii value when needed.
         """
+        if not self._logging.isEnabledFor(logging.WARNING):
+            return
         if len(args) == 1 and isinstance(args[0], dict) and not self.log_context.get('enable_pii'):
             args = (scrub_pii(args[0]),)
         log_stack_trace = kwargs.pop('log_stack_trace', None)
@@ -107,6 +109,8 @@ class Logger(object):
         self._logging.warning(msg, *args, **kwargs)
 
     def info(self, msg, *args, **kwargs):
+        if not self._logging.isEnabledFor(logging.INFO):
+            return
         if len(args) == 1 and isinstance(args[0], dict) and not self.log_context.get('enable_pii'):
             args = (scrub_pii(args[0]),)
         log_stack_trace = kwargs.pop('log_stack_trace', None)
@@ -114,6 +118,8 @@ class Logger(object):
         self._logging.info(msg, *args, **kwargs)
 
     def debug(self, msg, *args, **kwargs):
+        if not self._logging.isEnabledFor(logging.DEBUG):
+            return
         if len(args) == 1 and isinstance(args[0], dict) and not self.log_context.get('enable_pii'):
             args = (scrub_pii(args[0]),)
         log_stack_trace = kwargs.pop('log_stack_trace', None)
@@ -121,6 +127,8 @@ class Logger(object):
         self._logging.debug(msg, *args, **kwargs)
 
     def exception(self, msg, *args, **kwargs):
+        if not self._logging.isEnabledFor(logging.ERROR):
+            return
         if len(args) == 1 and isinstance(args[0], dict) and not self.log_context.get('enable_pii'):
             args = (scrub_pii(args[0]),)
         msg = self._log_message(msg)
@@ -35,8 +35,7 @@ try:
 except ImportError:
     from xml.etree import ElementTree as ET
 
-import requests
-
+from . import http_transport
 from . import log
 from . import util
 from . import xmlutil
@@ -76,40 +75,22 @@ class Mex(object):
     def discover(self):
         options = util.create_request_options(self, {'headers': {'Content-Type': 'application/soap+xml'}})
 
+        operation = "Mex Get"
+        resp = http_transport.send(self._call_context, self._log, operation, 'GET',
+                                   self._url, options['headers'])
+        self._handle_mex_document(resp.text)
+
+    def _handle_mex_document(self, mex_doc):
         try:
-            operation = "Mex Get"
-            resp = requests.get(self._url, headers=options['headers'],
-                                verify=self._call_context.get('verify_ssl', None),
-                                proxies=self._call_context.get('proxies', None))
-            util.log_return_correlation_id(self._log, operation, resp)
+            self._mex_doc = mex_doc
+            #options = {'errorHandler':self._log.error}
+            self._dom = ET.fromstring(self._mex_doc)
+            self._parents = {c:p for p in self._dom.iter() for c in p}
+            self._parse()
         except Exception:
-            self._log.exception(
-                "%(operation)s request failed", {"operation": operation})
+            self._log.info('Failed to parse mex response in to DOM')
             raise
 
-        if resp.status_code == 429:
-            resp.raise_for_status()  # Will raise requests.exceptions.HTTPError
-        if not util.is_http_success(resp.status_code):
-            return_error_string = u"{} request returned http error: {}".format(operation, resp.status_code)
-            error_response = ""
-            if resp.text:
-                return_error_string = u"{} and server response: {}".format(return_error_string, resp.text)
-                try:
-                    error_response = resp.json()
-                except ValueError:
-                    pass
-            raise AdalError(return_error_string, error_response)
-        else:
-            try:
-                self._mex_doc = resp.text
-                #options = {'errorHandler':self._log.error}
-                self._dom = ET.fromstring(self._mex_doc)
-                self._parents = {c:p for p in self._dom.iter() for c in p}
-                self._parse()
-            except Exception:
-                self._log.info('Failed to parse mex response in to DOM')
-                raise
-
     def _check_policy(self, policy_node):
         policy_id = policy_node.attrib["{{{}}}Id".format(XmlNamespaces.namespaces['wsu'])]
         
@@ -38,12 +38,12 @@ except ImportError:
     from urllib import urlencode # pylint: disable=no-name-in-module
     from urlparse import urlparse # pylint: disable=import-error,ungrouped-imports
 
-import requests
-
+from . import http_transport
 from . import log
 from . import util
 from .constants import OAuth2, TokenResponseFields, IdTokenFields
 from .adal_error import AdalError
+from .token_cache import TokenEntry
 
 TOKEN_RESPONSE_MAP = {
     OAuth2.ResponseParameters.TOKEN_TYPE : TokenResponseFields.TOKEN_TYPE,
@@ -58,7 +58,6 @@ TOKEN_RESPONSE_MAP = {
 }
 
 _REQ_OPTION = {'headers' : {'content-type': 'application/x-www-form-urlencoded'}}
-_ERROR_TEMPLATE = u"{} request returned http error: {}"
 
 
 def map_fields(in_obj, map_to):
@@ -180,11 +179,13 @@ class OAuth2Client(object):
 
         self._parse_optional_ints(wire_response, int_keys)
 
+        expires_on = None
         expires_in = wire_response.get(OAuth2.ResponseParameters.EXPIRES_IN)
         if expires_in:
             now = datetime.now()
             soon = timedelta(seconds=expires_in)
-            wire_response[OAuth2.ResponseParameters.EXPIRES_ON] = str(now + soon)
+            expires_on = now + soon
+            wire_response[OAuth2.ResponseParameters.EXPIRES_ON] = str(expires_on)
 
         created_on = wire_response.get(OAuth2.ResponseParameters.CREATED_ON)
         if created_on:
@@ -197,7 +198,9 @@ class OAuth2Client(object):
         if not wire_response.get(OAuth2.ResponseParameters.ACCESS_TOKEN):
             raise AdalError('wire_response is missing access_token', wire_response)
 
-        token_response = map_fields(wire_response, TOKEN_RESPONSE_MAP)
+        token_response = TokenEntry(map_fields(wire_response, TOKEN_RESPONSE_MAP))
+        if expires_on:
+            token_response.set_expires_on(expires_on)
 
         if wire_response.get(OAuth2.ResponseParameters.ID_TOKEN):
             id_token = self._parse_id_token(wire_response[OAuth2.ResponseParameters.ID_TOKEN])
@@ -258,35 +261,10 @@ class OAuth2Client(object):
         post_options = util.create_request_options(self, _REQ_OPTION)
 
         operation = "Get Token"
-
-        try:
-            resp = requests.post(token_url.geturl(), 
-                                 data=url_encoded_token_request, 
-                                 headers=post_options['headers'],
-                                 verify=self._call_context.get('verify_ssl', None),
-                                 proxies=self._call_context.get('proxies', None),
-                                 timeout=self._call_context.get('timeout', None))
-
-            util.log_return_correlation_id(self._log, operation, resp)
-        except Exception:
-            self._log.exception("%(operation)s request failed", {"operation": operation})
-            raise
-
-        if util.is_http_success(resp.status_code):
-            return self._handle_get_token_response(resp.text)
-        else:
-            if resp.status_code == 429:
-                resp.raise_for_status()  # Will raise requests.exceptions.HTTPError
-            return_error_string = _ERROR_TEMPLATE.format(operation, resp.status_code)
-            error_response = ""
-            if resp.text:
-                return_error_string = u"{} and server response: {}".format(return_error_string,
-                                                                           resp.text)
-                try:
-                    error_response = resp.json()
-                except ValueError:
-                    pass
-            raise AdalError(return_error_string, error_response)
+        resp = http_transport.send(self._call_context, self._log, operation, 'POST',
+                                   token_url.geturl(), post_options['headers'],
+                                   url_encoded_token_request)
+        return self._handle_get_token_response(resp.text)
 
     def get_user_code_info(self, oauth_parameters):
         device_code_url = self._create_device_code_url()
@@ -294,36 +272,12 @@ class OAuth2Client(object):
 
         post_options = util.create_request_options(self, _REQ_OPTION)
         operation = "Get Device Code"
-        try:
-            resp = requests.post(device_code_url.geturl(), 
-                                 data=url_encoded_code_request, 
-                                 headers=post_options['headers'],
-                                 verify=self._call_context.get('verify_ssl', None),
-                                 proxies=self._call_context.get('proxies', None),
-                                 timeout=self._call_context.get('timeout', None))
-            util.log_return_correlation_id(self._log, operation, resp)
-        except Exception:
-            self._log.exception("%(operation)s request failed", {"operation": operation})
-            raise
-
-        if util.is_http_success(resp.status_code):
-            user_code_info = self._handle_get_device_code_response(resp.text)
-            user_code_info['correlation_id'] = resp.headers.get('client-request-id')
-            return user_code_info
-        else:
-            if resp.status_code == 429:
-                resp.raise_for_status()  # Will raise requests.exceptions.HTTPError
-            return_error_string = _ERROR_TEMPLATE.format(operation, resp.status_code)
-            error_response = ""
-            if resp.text:
-                return_error_string = u"{} and server response: {}".format(return_error_string,
-                                                                           resp.text)
-                try:
-                    error_response = resp.json()
-                except ValueError:
-                    pass
-
-            raise AdalError(return_error_string, error_response)
+        resp = http_transport.send(self._call_context, self._log, operation, 'POST',
+                                   device_code_url.geturl(), post_options['headers'],
+                                   url_encoded_code_request)
+        user_code_info = self._handle_get_device_code_response(resp.text)
+        user_code_info['correlation_id'] = resp.headers.get('client-request-id')
+        return user_code_info
 
     def get_token_with_polling(self, oauth_parameters, refresh_internal, expires_in):
         token_url = self._create_token_url()
@@ -338,16 +292,13 @@ class OAuth2Client(object):
             if self._cancel_polling_request:
                 raise AdalError('Polling_Request_Cancelled')
 
-            resp = requests.post(
-                token_url.geturl(), 
-                data=url_encoded_code_request, headers=post_options['headers'],
-                proxies=self._call_context.get('proxies', None),
-                verify=self._call_context.get('verify_ssl', None))
+            # Errors other than throttling are polling states, read below
+            resp = http_transport.send(self._call_context, self._log, operation, 'POST',
+                                       token_url.geturl(), post_options['headers'],
+                                       url_encoded_code_request, check_status=False)
             if resp.status_code == 429:
                 resp.raise_for_status()  # Will raise requests.exceptions.HTTPError
 
-            util.log_return_correlation_id(self._log, operation, resp)
-
             wire_response = {} 
             if not util.is_http_success(resp.status_code):
                 # on error, the body should be json already 
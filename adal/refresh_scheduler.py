@@ -0,0 +1,154 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+import threading
+import time
+
+from .constants import TokenResponseFields, Misc
+from .token_cache import _get_expires_on_timestamp
+from .token_request import TokenRequest
+from . import log
+
+# pylint: disable=protected-access
+
+class RefreshScheduler(object):
+    '''Refreshes the access tokens cached by an AuthenticationContext before
+    they expire, on a background thread, so that acquire_token() can keep
+    answering from the cache instead of waiting on a refresh.
+
+    Only entries which have a refresh token and were issued by the authority
+    of the context are refreshed, and each at most once per ``interval``. A
+    failed refresh is logged and retried later; the entry stays in the cache,
+    so a caller still gets the usual refresh on demand.
+
+    Basic usage::
+
+        scheduler = RefreshScheduler(context)
+        scheduler.start()
+        ...
+        scheduler.stop()
+
+    :param AuthenticationContext context: The context whose cache is kept fresh.
+    :param float lead_time: (optional) How many seconds before its expiry an
+        access token is refreshed. Defaults to twice the clock skew buffer
+        acquire_token() applies, so that callers do not reach that buffer.
+    :param float interval: (optional) Maximum number of seconds between two
+        scans of the cache, which is how soon newly added entries are noticed.
+        Defaults to 60.
+    '''
+
+    def __init__(self, context, lead_time=None, interval=60):
+        self._context = context
+        self._lead_time = lead_time if lead_time is not None else 2 * Misc.CLOCK_BUFFER * 60
+        self._interval = interval
+        self._retry_after = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._log = log.Logger('RefreshScheduler', log.create_log_context())
+
+    def start(self):
+        '''Start the background thread. Calling it again has no effect.'''
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='adal-refresh-scheduler')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        '''Stop the background thread and wait for an ongoing refresh to end.'''
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stop_event.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def refresh_due_entries(self, now=None):
+        '''Refresh every cached entry which expires within the lead time.
+
+        This is what the background thread runs, and it can also be called
+        directly, e.g. from an application's own scheduler.
+
+        :param float now: (optional) Current time in seconds since the epoch.
+        :returns: the number of seconds until the next entry is due.
+        '''
+        now = time.time() if now is None else now
+        next_due = now + self._interval
+        authority = self._context.authority.url.lower()
+        for key, entry in list(self._context.cache.read_items()):
+            if (entry.get(TokenResponseFields._AUTHORITY) or '').lower() != authority or \
+                    not entry.get(TokenResponseFields.REFRESH_TOKEN):
+                continue
+            expires_on = _get_expires_on_timestamp(entry)
+            if expires_on is None:
+                continue
+            due = max(expires_on - self._lead_time, self._retry_after.get(key, 0))
+            if due > now:
+                next_due = min(next_due, due)
+                continue
+            if self._stop_event.is_set():
+                break
+            # Whatever the outcome, leave this entry alone for an interval, so
+            # that a failing or short lived token is not refreshed in a loop
+            self._retry_after[key] = now + self._interval
+            try:
+                self._refresh(entry)
+            except Exception: # pylint: disable=broad-except
+                self._log.exception('Refreshing a cached token ahead of its expiry failed')
+        for key in [k for k, t in self._retry_after.items() if t + self._interval < now]:
+            del self._retry_after[key]
+        return max(next_due - now, 0)
+
+    def _refresh(self, entry):
+        def token_func(self, call_context):
+            token_request = TokenRequest(
+                call_context, self,
+                entry[TokenResponseFields._CLIENT_ID], entry[TokenResponseFields.RESOURCE])
+            return token_request.refresh_cache_entry(entry)
+
+        self._log.debug('Refreshing a cached token ahead of its expiry')
+        return self._context._acquire_token(token_func)
+
+    def _run(self):
+        delay = 0
+        while not self._stop_event.wait(delay):
+            try:
+                delay = self.refresh_due_entries()
+            except Exception: # pylint: disable=broad-except
+                self._log.exception('Scanning the token cache failed')
+                delay = self._interval
+            # Do not spin on entries whose refresh keeps returning them due
+            delay = max(delay, 1)
@@ -0,0 +1,114 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+from email.utils import mktime_tz, parsedate_tz
+import random
+import socket
+import time
+
+import requests
+
+_now = getattr(time, 'monotonic', time.time)
+
+
+def _parse_retry_after(response):
+    '''Return the seconds the Retry-After header of response asks to wait,
+    given either as seconds or as an HTTP date, or None.'''
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0.0, mktime_tz(date) - time.time())
+
+
+class RetryPolicy(object):
+    '''Retries the HTTP requests of an AuthenticationContext which were
+    throttled, failed on the server side, or could not reach it.
+
+    A response carrying a Retry-After header is retried no sooner than it
+    asks. Otherwise the wait grows with decorrelated jitter: a random time
+    between base_delay and three times the previous wait, at most max_delay,
+    so that clients throttled together do not come back together. A retry
+    which would end after max_total seconds since the acquisition started is
+    not attempted, and the last response or error is reported instead.
+
+    :param int max_retries: (optional) Most retries of one request. Defaults to 3.
+    :param float base_delay: (optional) Shortest wait in seconds. Defaults to 0.5.
+    :param float max_delay: (optional) Longest wait in seconds, unless the
+        server asks for longer. Defaults to 30.
+    :param float max_total: (optional) Seconds an acquisition, with all its
+        requests and waits, may take before retries stop. Defaults to 60.
+    :param statuses: (optional) Status codes which are retried. Defaults to
+        429, 500, 502, 503 and 504.
+    :param errors: (optional) Exception classes, raised by the transport,
+        which are retried. Defaults to connection errors and timeouts.
+    '''
+
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=30, max_total=60,
+                 statuses=(429, 500, 502, 503, 504),
+                 errors=(requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                         socket.timeout)):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_total = max_total
+        self.statuses = frozenset(statuses)
+        self.errors = tuple(errors)
+
+    def is_retryable(self, response=None, error=None):
+        '''Whether a request which returned response, or raised error, may be
+        retried.'''
+        if error is not None:
+            return isinstance(error, self.errors)
+        return response.status_code in self.statuses
+
+    def next_delay(self, retries, previous_delay, started, response=None):
+        '''Return the seconds to wait before the next retry, or None when the
+        request should not be retried again.
+
+        :param int retries: How many times the request was retried already.
+        :param float previous_delay: The previous wait, or 0 before the first.
+        :param float started: When the acquisition started, on the clock of
+            retry_policy._now.
+        :param response: The response to retry, if there was one.
+        '''
+        if retries >= self.max_retries:
+            return None
+        delay = min(self.max_delay, random.uniform(
+            self.base_delay, max(self.base_delay, previous_delay * 3)))
+        retry_after = _parse_retry_after(response)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if _now() + delay > started + self.max_total:
+            return None
+        return delay
@@ -0,0 +1,209 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+import json
+import sqlite3
+import time
+
+from .constants import TokenResponseFields
+from .token_cache import (TokenCache, TokenCacheKey, _get_cache_key,
+                          _canonical, _iterate_json_values, _with_refresh_token,
+                          _get_expires_on_timestamp)
+
+# pylint: disable=protected-access
+
+_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS tokens (
+        authority TEXT NOT NULL,
+        resource TEXT NOT NULL,
+        client_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        is_mrrt INTEGER,
+        entry TEXT NOT NULL,
+        PRIMARY KEY (authority, resource, client_id, user_id))''',
+    'CREATE INDEX IF NOT EXISTS tokens_by_client ON tokens (client_id, user_id, is_mrrt)',
+    'CREATE INDEX IF NOT EXISTS tokens_by_user ON tokens (user_id, is_mrrt)',
+    )
+
+_INSERT = 'INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?, ?, ?)'
+_DELETE = 'DELETE FROM tokens WHERE authority = ? AND resource = ? AND client_id = ? AND user_id = ?'
+
+
+def _key_columns(key):
+    return (key.authority, key.resource, key.client_id, key.user_id)
+
+def _row(entry):
+    is_mrrt = entry.get(TokenResponseFields.IS_MRRT)
+    return _key_columns(_get_cache_key(entry)) + (
+        None if is_mrrt is None else int(is_mrrt), json.dumps(entry))
+
+
+class SqliteTokenCache(TokenCache):
+    '''Token cache stored in a SQLite database.
+
+    Every add and remove is written through to the database, so the cache
+    needs no separate persistence step, and lookups only load the matching
+    entries. An on-disk database is opened in WAL mode, which allows several
+    processes to share it.
+
+    :param str path: (optional) Path of the database file. Defaults to an
+        in-memory database.
+    :param str state: (optional) A string produced by :meth:`serialize`,
+        which replaces the content of the database.
+    :param float timeout: (optional) How many seconds to wait for another
+        process to release its lock on the database. Defaults to 30.
+    '''
+
+    def __init__(self, path=':memory:', state=None, timeout=30):
+        super(SqliteTokenCache, self).__init__()
+        self._connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        if path != ':memory:':
+            self._connection.execute('PRAGMA journal_mode=WAL')
+        with self._connection:
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+        if state:
+            self.deserialize(state)
+        self.has_state_changed = False
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def find(self, query):
+        with self._lock:
+            return self._select(query)
+
+    def _select(self, query):
+        conditions = []
+        parameters = []
+        is_mrrt = query.get(TokenResponseFields.IS_MRRT)
+        if is_mrrt is not None:
+            conditions.append('is_mrrt = ?')
+            parameters.append(int(is_mrrt))
+        for column, field in (('user_id', TokenResponseFields.USER_ID),
+                              ('client_id', TokenResponseFields._CLIENT_ID)):
+            value = query.get(field)
+            if value is not None:
+                conditions.append(column + ' = ?')
+                parameters.append(_canonical(value))
+        statement = 'SELECT entry FROM tokens'
+        if conditions:
+            statement += ' WHERE ' + ' AND '.join(conditions)
+        rows = self._connection.execute(statement, parameters).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def remove(self, entries):
+        with self._lock, self._connection:
+            self._delete(entries)
+
+    def add(self, entries):
+        with self._lock, self._connection:
+            self._insert(entries)
+
+    def replace(self, entries_to_remove, entries_to_add):
+        with self._lock, self._connection:
+            self._delete(entries_to_remove)
+            self._insert(entries_to_add)
+
+    def update_refresh_tokens(self, query, refresh_token, entries_to_remove, entries_to_add):
+        # Read and write in one write transaction, so that no other process
+        # rotates the entries in between
+        with self._lock, self._connection:
+            self._connection.execute('BEGIN IMMEDIATE')
+            updated = _with_refresh_token(
+                self._select(query), refresh_token, entries_to_remove + entries_to_add)
+            self._delete(entries_to_remove)
+            self._insert(updated + entries_to_add)
+            return updated
+
+    def sweep_expired(self, now=None):
+        '''Delete the rows whose access token has expired and which have no
+        refresh token to renew it.
+
+        :param float now: (optional) Current time in seconds since the epoch.
+        :returns: the number of rows deleted.
+        '''
+        now = time.time() if now is None else now
+        with self._lock, self._connection:
+            self._connection.execute('BEGIN IMMEDIATE')
+            expired = []
+            for row in self._connection.execute('SELECT entry FROM tokens'):
+                entry = json.loads(row[0])
+                if entry.get(TokenResponseFields.REFRESH_TOKEN):
+                    continue
+                expires_on = _get_expires_on_timestamp(entry)
+                if expires_on is not None and expires_on <= now:
+                    expired.append(entry)
+            self._delete(expired)
+        return len(expired)
+
+    def serialize_journal(self):
+        raise NotImplementedError(
+            'SqliteTokenCache writes every change through to its database, and keeps no journal')
+
+    def should_compact(self):
+        raise NotImplementedError(
+            'SqliteTokenCache writes every change through to its database, and keeps no journal')
+
+    def _delete(self, entries):
+        for e in entries:
+            cursor = self._connection.execute(_DELETE, _key_columns(_get_cache_key(e)))
+            if cursor.rowcount:
+                self.has_state_changed = True
+
+    def _insert(self, entries):
+        self._connection.executemany(_INSERT, [_row(e) for e in entries])
+        self.has_state_changed = True
+
+    def serialize(self):
+        with self._lock:
+            rows = self._connection.execute('SELECT entry FROM tokens').fetchall()
+        return json.dumps([json.loads(row[0]) for row in rows])
+
+    def deserialize(self, state):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM tokens')
+            if state:
+                for value in _iterate_json_values(state):
+                    if isinstance(value, list):
+                        self._connection.executemany(_INSERT, [_row(t) for t in value])
+                    elif value['op'] == 'add':
+                        self._connection.execute(_INSERT, _row(value['entry']))
+                    elif value['op'] == 'remove':
+                        self._connection.execute(
+                            _DELETE, _key_columns(TokenCacheKey(*value['key'])))
+                    else:
+                        raise ValueError(
+                            'Unknown token cache journal record: {}'.format(value['op']))
+
+    def read_items(self):
+        '''output list of tuples in (key, authentication-result)'''
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT authority, resource, client_id, user_id, entry FROM tokens').fetchall()
+        return [(TokenCacheKey(*row[:4]), json.loads(row[4])) for row in rows]
@@ -25,38 +25,84 @@
 #
 #------------------------------------------------------------------------------
 
+import calendar
+from collections import OrderedDict
+from datetime import datetime
+import heapq
+import itertools
 import json
 import threading
+import time
 
-from .constants import TokenResponseFields
+from dateutil import parser
 
-def _string_cmp(str1, str2):
-    '''Case insensitive comparison. Return true if both are None'''
-    str1 = str1 if str1 is not None else ''
-    str2 = str2 if str2 is not None else ''
-    return str1.lower() == str2.lower()
+from .constants import TokenResponseFields, IdTokenFields
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+try:
+    from sys import intern as _intern
+except ImportError:
+    _intern = intern # pylint: disable=undefined-variable
+
+def _normalize(value):
+    '''Fold a string for case insensitive comparison. None is taken as empty'''
+    return value.lower() if value is not None else ''
+
+def _intern_value(value):
+    try:
+        return _intern(value)
+    except TypeError: # Python 2 can only intern byte strings, and not None
+        return value
+
+def _canonical(value):
+    '''Fold and intern a string, so that equal values share one object'''
+    return _intern_value(_normalize(value))
 
 class TokenCacheKey(object): # pylint: disable=too-few-public-methods
+    '''Case insensitive key of a cache entry.
+
+    The fields are stored in their canonical, case folded form and the hash is
+    computed once, so keys that differ only in case land in the same bucket.
+    '''
+    __slots__ = ('authority', 'resource', 'client_id', 'user_id', '_hash')
+
     def __init__(self, authority, resource, client_id, user_id):
-        self.authority = authority
-        self.resource = resource
-        self.client_id = client_id
-        self.user_id = user_id
+        self.authority = _canonical(authority)
+        self.resource = _canonical(resource)
+        self.client_id = _canonical(client_id)
+        self.user_id = _canonical(user_id)
+        self._hash = hash((self.authority, self.resource, self.client_id, self.user_id))
 
     def __hash__(self):
-        return hash((self.authority, self.resource, self.client_id, self.user_id))
+        return self._hash
 
     def __eq__(self, other):
-        return _string_cmp(self.authority, other.authority) and \
-               _string_cmp(self.resource, other.resource) and \
-               _string_cmp(self.client_id, other.client_id) and \
-               _string_cmp(self.user_id, other.user_id)
+        if not isinstance(other, TokenCacheKey):
+            return False
+        return self._hash == other._hash and \
+               self.authority == other.authority and \
+               self.resource == other.resource and \
+               self.client_id == other.client_id and \
+               self.user_id == other.user_id
 
     def __ne__(self, other):
         return not self == other
 
 # pylint: disable=protected-access
 
+def _with_refresh_token(entries, refresh_token, skipped_entries):
+    '''Copies of entries with refresh_token, leaving out those which have it
+    already or share a key with one of skipped_entries.'''
+    skipped_keys = set(_get_cache_key(e) for e in skipped_entries)
+    return [
+        TokenEntry(e, **{TokenResponseFields.REFRESH_TOKEN: refresh_token}) for e in entries
+        if e.get(TokenResponseFields.REFRESH_TOKEN) != refresh_token
+        and _get_cache_key(e) not in skipped_keys]
+
 def _get_cache_key(entry):
     return TokenCacheKey(
         entry.get(TokenResponseFields._AUTHORITY), 
@@ -64,63 +110,559 @@ def _get_cache_key(entry):
         entry.get(TokenResponseFields._CLIENT_ID), 
         entry.get(TokenResponseFields.USER_ID))
 
+# Every combination of the fields a cache query can filter on. A field left out
+# of a combination is a wildcard, which is how a None value in a query works.
+_INDEX_MASKS = [m for m in itertools.product((True, False), repeat=3) if any(m)]
+
+def _get_index_values(is_mrrt, user_id, client_id):
+    return (is_mrrt, _canonical(user_id), _canonical(client_id))
+
+def _get_entry_index_values(entry):
+    return _get_index_values(
+        entry.get(TokenResponseFields.IS_MRRT),
+        entry.get(TokenResponseFields.USER_ID),
+        entry.get(TokenResponseFields._CLIENT_ID))
+
+def _project(mask, values):
+    return tuple(v for m, v in zip(mask, values) if m)
+
+# The formats str(datetime) produces, which is how ADAL writes expiresOn
+_EXPIRES_ON_FORMATS = ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S')
+
+def _get_timestamp(expiry):
+    if expiry.tzinfo is None: # ADAL writes expiresOn in local time
+        seconds = time.mktime(expiry.timetuple())
+    else:
+        seconds = calendar.timegm(expiry.utctimetuple())
+    return seconds + expiry.microsecond / 1e6
+
+def _parse_expires_on(expires_on):
+    if not expires_on:
+        return None
+    for date_format in _EXPIRES_ON_FORMATS:
+        try:
+            return _get_timestamp(datetime.strptime(expires_on, date_format))
+        except (ValueError, TypeError):
+            pass
+    try:
+        return _get_timestamp(parser.parse(expires_on))
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+def _get_expires_on_timestamp(entry):
+    '''The expiry of the access token of an entry, in seconds since the epoch'''
+    if isinstance(entry, (TokenEntry, CompactTokenEntry)):
+        return entry.get_expires_on_timestamp()
+    return _parse_expires_on(entry.get(TokenResponseFields.EXPIRES_ON))
+
+
+class TokenEntry(dict):
+    '''A cache entry, or token response. It is a plain dict for its users, which
+    also remembers the expiry of its access token as a timestamp, so that
+    expiresOn is parsed once rather than on every cache hit.'''
+    __slots__ = ('_expiry',)
+
+    def __init__(self, *args, **kwargs):
+        super(TokenEntry, self).__init__(*args, **kwargs)
+        self._expiry = None # (expiresOn, timestamp)
+
+    # With a None state, copy and pickle would skip __setstate__ and leave
+    # the slot unset, so the state is always a tuple
+    def __getstate__(self):
+        return (self._expiry,)
+
+    def __setstate__(self, state):
+        self._expiry = state[0] if state else None
+
+    def set_expires_on(self, expiry):
+        '''Set expiresOn from a local, naive datetime.'''
+        self[TokenResponseFields.EXPIRES_ON] = str(expiry)
+        self._expiry = (self[TokenResponseFields.EXPIRES_ON], _get_timestamp(expiry))
+
+    def get_expires_on_timestamp(self):
+        '''The expiry of the access token in seconds since the epoch, or None.'''
+        expires_on = self.get(TokenResponseFields.EXPIRES_ON)
+        expiry = getattr(self, '_expiry', None)
+        if expiry is None or expiry[0] != expires_on:
+            expiry = self._expiry = (expires_on, _parse_expires_on(expires_on))
+        return expiry[1]
+
+
+# The fields of a cached token response, stored in slots by CompactTokenEntry
+_COMPACT_FIELDS = (
+    TokenResponseFields._AUTHORITY,
+    TokenResponseFields._CLIENT_ID,
+    TokenResponseFields.RESOURCE,
+    TokenResponseFields.USER_ID,
+    TokenResponseFields.IS_MRRT,
+    TokenResponseFields.TOKEN_TYPE,
+    TokenResponseFields.ACCESS_TOKEN,
+    TokenResponseFields.REFRESH_TOKEN,
+    TokenResponseFields.CREATED_ON,
+    TokenResponseFields.EXPIRES_ON,
+    TokenResponseFields.EXPIRES_IN,
+    IdTokenFields.IS_USER_ID_DISPLAYABLE,
+    IdTokenFields.TENANT_ID,
+    IdTokenFields.GIVE_NAME,
+    IdTokenFields.FAMILY_NAME,
+    IdTokenFields.IDENTITY_PROVIDER,
+    'oid',
+    )
+_COMPACT_FIELD_SET = frozenset(_COMPACT_FIELDS)
+
+# The fields whose values repeat across entries, so that interning them saves
+# a copy per entry
+_INTERNED_FIELDS = frozenset([
+    TokenResponseFields._AUTHORITY,
+    TokenResponseFields._CLIENT_ID,
+    TokenResponseFields.RESOURCE,
+    TokenResponseFields.USER_ID,
+    TokenResponseFields.TOKEN_TYPE,
+    IdTokenFields.TENANT_ID,
+    IdTokenFields.IDENTITY_PROVIDER,
+    ])
+
+_MISSING = object()
+
+class CompactTokenEntry(Mapping):
+    '''A read-only, memory efficient form of a cache entry.
+
+    The fields of a token response are kept in slots rather than in a hash
+    table of their own, the authority, client id, resource and similar values
+    are interned so that every entry shares one copy of them, and the expiry
+    is kept as a timestamp. It is a Mapping with the same items as the entry
+    it was built from, and :meth:`to_dict` turns it back into a dict.
+    '''
+    __slots__ = _COMPACT_FIELDS + ('_extra', '_expiry')
+
+    def __init__(self, entry):
+        extra = None
+        for name, value in entry.items():
+            if name in _COMPACT_FIELD_SET:
+                setattr(self, name, _intern_value(value) if name in _INTERNED_FIELDS else value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[name] = value
+        self._extra = extra
+        # The expiry parsed by the entry is stale if expiresOn changed since
+        expiry = getattr(entry, '_expiry', None)
+        if expiry is not None and expiry[0] != entry.get(TokenResponseFields.EXPIRES_ON):
+            expiry = None
+        self._expiry = expiry
+
+    def __getitem__(self, name):
+        if name in _COMPACT_FIELD_SET:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                return value
+        elif self._extra is not None and name in self._extra:
+            return self._extra[name]
+        raise KeyError(name)
+
+    def __iter__(self):
+        for name in _COMPACT_FIELDS:
+            if getattr(self, name, _MISSING) is not _MISSING:
+                yield name
+        if self._extra is not None:
+            for name in self._extra:
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def get_expires_on_timestamp(self):
+        '''The expiry of the access token in seconds since the epoch, or None.'''
+        if self._expiry is None:
+            expires_on = self.get(TokenResponseFields.EXPIRES_ON)
+            self._expiry = (expires_on, _parse_expires_on(expires_on))
+        return self._expiry[1]
+
+    def to_dict(self):
+        '''A TokenEntry with the same items.'''
+        entry = TokenEntry()
+        for name in _COMPACT_FIELDS:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                entry[name] = value
+        if self._extra is not None:
+            entry.update(self._extra)
+        entry._expiry = self._expiry
+        return entry
+
+
+def _iterate_json_values(state):
+    decoder = json.JSONDecoder()
+    position = 0
+    while True:
+        while position < len(state) and state[position].isspace():
+            position += 1
+        if position == len(state):
+            return
+        value, position = decoder.raw_decode(state, position)
+        yield value
+
+
+class _ReadWriteLock(object):
+    '''A reentrant lock, held either by one writer or by any number of readers.
+
+    Used as a context manager it is taken exclusively, like an RLock, and
+    ``with lock.shared():`` takes it for reading. A thread holding the lock
+    in any way may take it for reading again, but a reader cannot upgrade to
+    writing. Waiting writers hold off new readers, so they cannot starve.
+    '''
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._writer = None
+        self._write_count = 0
+        self._readers = {} # thread -> number of shared holds
+        self._waiting_writers = 0
+        self._shared = _SharedLock(self)
+
+    def acquire(self):
+        me = threading.current_thread()
+        with self._condition:
+            if self._writer is me:
+                self._write_count += 1
+                return True
+            if me in self._readers:
+                raise RuntimeError('A shared lock cannot be upgraded to an exclusive one')
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._write_count = 1
+            return True
+
+    def release(self):
+        with self._condition:
+            if self._writer is not threading.current_thread():
+                raise RuntimeError('Cannot release an exclusive lock which is not held')
+            self._write_count -= 1
+            if not self._write_count:
+                self._writer = None
+                self._condition.notify_all()
+
+    def acquire_shared(self):
+        me = threading.current_thread()
+        with self._condition:
+            if self._writer is not me and me not in self._readers:
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_shared(self):
+        me = threading.current_thread()
+        with self._condition:
+            count = self._readers.get(me)
+            if not count:
+                raise RuntimeError('Cannot release a shared lock which is not held')
+            if count > 1:
+                self._readers[me] = count - 1
+            else:
+                del self._readers[me]
+                if not self._readers:
+                    self._condition.notify_all()
+
+    def shared(self):
+        return self._shared
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class _SharedLock(object): # pylint: disable=too-few-public-methods
+    def __init__(self, lock):
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire_shared()
+
+    def __exit__(self, *args):
+        self._lock.release_shared()
+
 
 class TokenCache(object):
-    def __init__(self, state=None):
-        self._cache = {}
-        self._lock = threading.RLock()
+    '''In-memory token cache, which can be persisted as a JSON string.
+
+    :param str state: (optional) A string produced by :meth:`serialize`,
+        optionally followed by strings produced by :meth:`serialize_journal`.
+    :param bool journal: (optional) When True, the cache records the entries
+        added and removed since it was last serialized, so that they can be
+        appended to the persisted state by :meth:`serialize_journal` instead
+        of rewriting the whole cache each time. Defaults to False.
+    :param int capacity: (optional) Maximum number of entries. When it is
+        exceeded, entries whose access token expired and which have no
+        refresh token are dropped first, then the least recently used ones.
+        Defaults to None, which means unbounded.
+    :param bool concurrent_reads: (optional) When True, lookups take a shared
+        lock, so that they run concurrently with each other and with
+        :meth:`serialize` instead of queuing behind one another. Only changes
+        wait for an exclusive lock. This pays off when many threads share one
+        cache; an uncontended lookup is slightly slower. Defaults to False.
+    :param bool compact: (optional) When True, entries are stored as
+        :class:`CompactTokenEntry` objects, which take a fraction of the
+        memory of dicts. Lookups then return a dict copy of each entry, which
+        costs a little time per match. Defaults to False.
+    '''
+
+    # Number of journal records after which should_compact() recommends
+    # writing a full snapshot again.
+    JOURNAL_COMPACTION_THRESHOLD = 1000
+
+    def __init__(self, state=None, journal=False, capacity=None, concurrent_reads=False,
+                 compact=False):
+        self._cache = OrderedDict()
+        self._compact = compact
+        self._indexes = dict((mask, {}) for mask in _INDEX_MASKS)
+        self._lock = _ReadWriteLock() if concurrent_reads else threading.RLock()
+        self._touch_lock = threading.Lock()
+        self._journal = {} if journal else None
+        self._journal_length = 0
+        self._capacity = capacity
+        # (expiry, sequence, key, entry), ordered by the access token expiry.
+        # It is only maintained once sweeping is needed, and an item is stale
+        # when its entry is no longer the one cached under its key.
+        self._expiry_heap = [] if capacity is not None else None
+        self._expiry_sequence = itertools.count()
         if state:
             self.deserialize(state)
         self.has_state_changed = False
 
     def find(self, query):
-        with self._lock:
-            return self._query_cache(
+        with self._reading():
+            matches = self._query_cache(
                 query.get(TokenResponseFields.IS_MRRT), 
                 query.get(TokenResponseFields.USER_ID), 
                 query.get(TokenResponseFields._CLIENT_ID))
+            if self._capacity is None:
+                return self._entries(matches)
+            # Concurrent readers reorder the entries, one at a time
+            with self._touch_lock:
+                for key in list(matches):
+                    self._touch(key)
+                return self._entries(matches)
 
     def remove(self, entries):
         with self._lock:
             for e in entries:
                 key = _get_cache_key(e)
-                removed = self._cache.pop(key, None)
-                if removed is not None:
+                if self._remove_key(key) is not None:
+                    self._record(key, None)
                     self.has_state_changed = True
 
     def add(self, entries):
         with self._lock:
             for e in entries:
-                key = _get_cache_key(e)
-                self._cache[key] = e
+                key = self._add_entry(e)
+                self._record(key, e)
             self.has_state_changed = True
+            if self._capacity is not None and len(self._cache) > self._capacity:
+                self.sweep_expired()
+                while len(self._cache) > self._capacity:
+                    key = next(iter(self._cache))
+                    self._remove_key(key)
+                    self._record(key, None)
+
+    def replace(self, entries_to_remove, entries_to_add):
+        '''Remove some entries and add others, as one atomic change.
+
+        Lookups from other threads see either the cache before the change or
+        after it. Entries are removed first, so an entry in both lists ends
+        up added.
+        '''
+        with self._lock:
+            self.remove(entries_to_remove)
+            self.add(entries_to_add)
+
+    def update_refresh_tokens(self, query, refresh_token, entries_to_remove, entries_to_add):
+        '''Like replace, and in the same atomic change, also set refresh_token
+        on the other cached entries which match query.
+
+        :returns: the updated copies of those entries.
+        '''
+        with self._lock:
+            updated = _with_refresh_token(
+                self.find(query), refresh_token, entries_to_remove + entries_to_add)
+            self.replace(entries_to_remove, updated + entries_to_add)
+            return updated
+
+    def sweep_expired(self, now=None):
+        '''Remove the entries whose access token has expired and which have
+        no refresh token to renew it.
+
+        :param float now: (optional) Current time in seconds since the epoch.
+        :returns: the number of entries removed.
+        '''
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            if self._expiry_heap is None:
+                self._expiry_heap = []
+                for key, entry in self._cache.items():
+                    self._push_expiry(key, entry)
+            heap = self._expiry_heap
+            while heap and heap[0][0] <= now:
+                _, _, key, entry = heapq.heappop(heap)
+                if self._cache.get(key) is not entry:
+                    continue
+                if entry.get(TokenResponseFields.REFRESH_TOKEN):
+                    continue
+                self._remove_key(key)
+                self._record(key, None)
+                removed += 1
+            if removed:
+                self.has_state_changed = True
+        return removed
 
     def serialize(self):
+        '''Output a full snapshot of the cache. This also starts a new journal.'''
+        if self._journal is None:
+            with self._reading():
+                with self._touch_lock:
+                    entries = self._entries(self._cache)
+                return json.dumps(entries)
+        with self._lock:
+            self._journal.clear()
+            self._journal_length = 0
+            return json.dumps(self._entries(self._cache))
+
+    def serialize_journal(self):
+        '''Output the changes made since the cache was last serialized.
+
+        The output is meant to be appended to the previously persisted state,
+        and it is an empty string when nothing changed. Once
+        :meth:`should_compact` returns True, persist :meth:`serialize` instead,
+        so that the journal does not grow without bound. Typical usage::
+
+            if cache.should_compact():
+                overwrite(path, cache.serialize())
+            else:
+                append(path, cache.serialize_journal())
+        '''
         with self._lock:
-            return json.dumps(list(self._cache.values()))
+            if self._journal is None:
+                raise ValueError('This TokenCache was created without journal=True')
+            records = []
+            for key, entry in self._journal.items():
+                if entry is None:
+                    records.append({'op': 'remove', 'key': [
+                        key.authority, key.resource, key.client_id, key.user_id]})
+                else:
+                    records.append({'op': 'add', 'entry': entry})
+            self._journal.clear()
+            self._journal_length += len(records)
+            return ''.join(json.dumps(r) + '\n' for r in records)
+
+    def should_compact(self):
+        '''Whether the persisted journal has grown enough to be replaced by a
+        full snapshot.'''
+        with self._reading():
+            return self._journal_length >= self.JOURNAL_COMPACTION_THRESHOLD
 
     def deserialize(self, state):
         with self._lock:
             self._cache.clear()
+            for index in self._indexes.values():
+                index.clear()
+            if self._expiry_heap is not None:
+                del self._expiry_heap[:]
+            if self._journal is not None:
+                self._journal.clear()
+            self._journal_length = 0
             if state:
-                tokens = json.loads(state)
-                for t in tokens:
-                    key = _get_cache_key(t)
-                    self._cache[key] = t
+                for value in _iterate_json_values(state):
+                    if isinstance(value, list):
+                        for t in value:
+                            self._add_entry(TokenEntry(t))
+                    else:
+                        self._replay(value)
 
     def read_items(self):
         '''output list of tuples in (key, authentication-result)'''
-        with self._lock:
-            return self._cache.items()
+        # A snapshot, which other threads may keep changing the cache after
+        with self._reading():
+            if self._compact:
+                return [(k, e.to_dict()) for k, e in self._cache.items()]
+            return list(self._cache.items())
+
+    def _reading(self):
+        '''The lock to hold while only reading the cache'''
+        if isinstance(self._lock, _ReadWriteLock):
+            return self._lock.shared()
+        return self._lock
+
+    def _replay(self, record):
+        if record['op'] == 'add':
+            self._add_entry(TokenEntry(record['entry']))
+        elif record['op'] == 'remove':
+            self._remove_key(TokenCacheKey(*record['key']))
+        else:
+            raise ValueError('Unknown token cache journal record: {}'.format(record['op']))
+        self._journal_length += 1
+
+    def _record(self, key, entry):
+        if self._journal is not None:
+            self._journal[key] = entry
+
+    def _entries(self, entries_by_key):
+        if self._compact:
+            return [e.to_dict() for e in entries_by_key.values()]
+        return list(entries_by_key.values())
+
+    def _add_entry(self, entry):
+        key = _get_cache_key(entry)
+        if self._compact:
+            entry = CompactTokenEntry(entry)
+        self._remove_key(key)
+        self._cache[key] = entry
+        values = _get_entry_index_values(entry)
+        for mask, index in self._indexes.items():
+            index.setdefault(_project(mask, values), {})[key] = entry
+        if self._expiry_heap is not None:
+            self._push_expiry(key, entry)
+        return key
+
+    def _push_expiry(self, key, entry):
+        heap = self._expiry_heap
+        if len(heap) > 2 * len(self._cache) + 64:
+            # Too many stale items, only keep the current entries
+            heap[:] = [i for i in heap if self._cache.get(i[2]) is i[3]]
+            heapq.heapify(heap)
+        expiry = _get_expires_on_timestamp(entry)
+        if expiry is not None:
+            heapq.heappush(heap, (expiry, next(self._expiry_sequence), key, entry))
+
+    def _touch(self, key):
+        try:
+            self._cache.move_to_end(key)
+        except AttributeError: # Python 2
+            self._cache[key] = self._cache.pop(key)
+
+    def _remove_key(self, key):
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            values = _get_entry_index_values(entry)
+            for mask, index in self._indexes.items():
+                projection = _project(mask, values)
+                bucket = index.get(projection)
+                if bucket is not None:
+                    bucket.pop(key, None)
+                    if not bucket:
+                        del index[projection]
+        return entry
 
     def _query_cache(self, is_mrrt, user_id, client_id):
-        matches = []
-        for k in self._cache:
-            v = self._cache[k]
-            #None value will be taken as wildcard match
-            #pylint: disable=too-many-boolean-expressions
-            if ((is_mrrt is None or is_mrrt == v.get(TokenResponseFields.IS_MRRT)) and 
-                    (user_id is None or _string_cmp(user_id, v.get(TokenResponseFields.USER_ID))) and 
-                    (client_id is None or _string_cmp(client_id, v.get(TokenResponseFields._CLIENT_ID)))):
-                matches.append(v)
-        return matches
+        #None value will be taken as wildcard match
+        mask = (is_mrrt is not None, user_id is not None, client_id is not None)
+        if not any(mask):
+            return self._cache
+        values = _get_index_values(is_mrrt, user_id, client_id)
+        return self._indexes[mask].get(_project(mask, values)) or {}
@@ -343,6 +343,11 @@ class TokenRequest(object):
     def get_token_with_refresh_token(self, refresh_token, client_secret):
         return self._get_token_with_refresh_token(refresh_token, None, client_secret)
 
+    def refresh_cache_entry(self, entry):
+        self._log.debug("Refreshing a cached token.")
+        self._cache_driver = self._create_cache_driver()
+        return self._cache_driver._refresh_expired_entry(entry) #pylint: disable=protected-access
+
     def get_token_from_cache_with_refresh(self, user_id):
         self._log.debug("Getting token from cache with refresh if necessary.")
         self._user_id = user_id
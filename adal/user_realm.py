@@ -33,9 +33,8 @@ except ImportError:
     from urllib import quote, urlencode #pylint: disable=no-name-in-module
     from urlparse import urlunparse #pylint: disable=import-error
 
-import requests
-
 from . import constants
+from . import http_transport
 from . import log
 from . import util
 from .adal_error import AdalError 
@@ -144,25 +143,6 @@ class UserRealm(object):
                         {"user_realm_url": user_realm_url.geturl()})
 
         operation = 'User Realm Discovery'
-        resp = requests.get(user_realm_url.geturl(), headers=options['headers'],
-                            proxies=self._call_context.get('proxies', None),
-                            verify=self._call_context.get('verify_ssl', None))
-        util.log_return_correlation_id(self._log, operation, resp)
-
-        if resp.status_code == 429:
-            resp.raise_for_status()  # Will raise requests.exceptions.HTTPError
-        if not util.is_http_success(resp.status_code):
-            return_error_string = u"{} request returned http error: {}".format(operation, 
-                                                                               resp.status_code)
-            error_response = ""
-            if resp.text:
-                return_error_string = u"{} and server response: {}".format(return_error_string, resp.text)
-                try:
-                    error_response = resp.json()
-                except ValueError:
-                    pass
-
-            raise AdalError(return_error_string, error_response)
-
-        else:
-            self._parse_discovery_response(resp.text)
+        resp = http_transport.send(self._call_context, self._log, operation, 'GET',
+                                   user_realm_url.geturl(), options['headers'])
+        self._parse_discovery_response(resp.text)
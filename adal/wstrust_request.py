@@ -28,8 +28,7 @@
 import uuid
 from datetime import datetime, timedelta
 
-import requests
-
+from . import http_transport
 from . import log
 from . import util
 from . import wstrust_response
@@ -126,7 +125,7 @@ class WSTrustRequest(object):
         wstrust_resp.parse()
         return wstrust_resp
 
-    def acquire_token(self, username, password):
+    def _create_rst_request_options(self, username, password):
         if self._wstrust_endpoint_version == WSTrustVersion.UNDEFINED:
             raise AdalError('Unsupported wstrust endpoint version. Current support version is wstrust2005 or wstrust13.')
 
@@ -142,28 +141,13 @@ class WSTrustRequest(object):
         options = util.create_request_options(self, headers)
         self._log.debug("Sending RST to: %(wstrust_endpoint)s",
                         {"wstrust_endpoint": self._wstrust_endpoint_url})
+        return options
+
+    def acquire_token(self, username, password):
+        options = self._create_rst_request_options(username, password)
 
         operation = "WS-Trust RST"
-        resp = requests.post(self._wstrust_endpoint_url, headers=options['headers'], data=rst,
-                             allow_redirects=True,
-                             verify=self._call_context.get('verify_ssl', None),
-                             proxies=self._call_context.get('proxies', None),
-                             timeout=self._call_context.get('timeout', None))
-
-        util.log_return_correlation_id(self._log, operation, resp)
-
-        if resp.status_code == 429:
-            resp.raise_for_status()  # Will raise requests.exceptions.HTTPError
-        if not util.is_http_success(resp.status_code):
-            return_error_string = u"{} request returned http error: {}".format(operation, resp.status_code)
-            error_response = ""
-            if resp.text:
-                return_error_string = u"{} and server response: {}".format(return_error_string, resp.text)
-                try:
-                    error_response = resp.json()
-                except ValueError:
-                    pass
-
-            raise AdalError(return_error_string, error_response)
-        else:
-            return self._handle_rstr(resp.text)
+        resp = http_transport.send(self._call_context, self._log, operation, 'POST',
+                                   self._wstrust_endpoint_url, options['headers'],
+                                   options['body'])
+        return self._handle_rstr(resp.text)
@@ -0,0 +1,93 @@
+﻿#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation. 
+# All rights reserved.
+# 
+# This code is licensed under the MIT License.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+"""Measures the latency of a cache hit through AuthenticationContext.
+
+Usage::
+
+    python benchmarks/acquire_token_hit.py
+
+Every acquire_token call used to create a log context, validate the
+authority and build a TokenRequest and a CacheDriver, each with its own
+Logger, before looking at the cache. A hit for an unexpired token is now
+served straight from the cache. The "full path" line times the machinery a
+hit went through before; the "fast path" line times acquire_token today.
+"""
+from __future__ import print_function
+
+from datetime import datetime, timedelta
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position,protected-access
+import adal
+from adal.token_request import TokenRequest
+
+LOOKUPS = 20000
+AUTHORITY = 'https://login.microsoftonline.com/contoso.onmicrosoft.com'
+RESOURCE = 'https://graph.windows.net'
+CLIENT_ID = 'client'
+USER_ID = 'user@contoso.com'
+
+
+def create_context():
+    entry = {
+        '_authority': AUTHORITY,
+        '_clientId': CLIENT_ID,
+        'resource': RESOURCE,
+        'userId': USER_ID,
+        'isMRRT': True,
+        'accessToken': 'access-token',
+        'refreshToken': 'refresh-token',
+        'expiresOn': str(datetime.now() + timedelta(hours=1)),
+        }
+    cache = adal.TokenCache(json.dumps([entry]))
+    return adal.AuthenticationContext(AUTHORITY, validate_authority=False, cache=cache)
+
+
+def measure(func):
+    return min(timeit.repeat(func, number=LOOKUPS, repeat=5)) / LOOKUPS * 1e6
+
+
+def main():
+    context = create_context()
+
+    def token_func(self, call_context):
+        token_request = TokenRequest(call_context, self, CLIENT_ID, RESOURCE)
+        return token_request.get_token_from_cache_with_refresh(USER_ID)
+
+    full = measure(lambda: context._acquire_token(token_func))
+    fast = measure(lambda: context.acquire_token(RESOURCE, USER_ID, CLIENT_ID))
+    print('{:<36} {:>8.2f} us'.format('acquire_token hit, full path', full))
+    print('{:<36} {:>8.2f} us'.format('acquire_token hit, fast path', fast))
+
+
+if __name__ == '__main__':
+    main()
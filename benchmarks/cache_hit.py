@@ -0,0 +1,125 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+"""Measures the cost of a cache hit in CacheDriver.find.
+
+Usage::
+
+    python benchmarks/cache_hit.py
+
+Cache hits used to parse expiresOn with dateutil every time. Token entries now
+remember the parsed expiry, so a hit only compares two numbers.
+
+Cache hits also used to hash the access and refresh tokens for a debug log
+message even when debug logging was off. The benchmark counts the hashes a
+hit computes at the default ERROR level and at DEBUG, with a handler that
+discards the records after formatting them.
+"""
+from __future__ import print_function
+
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import sys
+import timeit
+
+from dateutil import parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position,protected-access
+from adal import cache_driver
+from adal.cache_driver import CacheDriver
+from adal.log import ADAL_LOGGER_NAME, create_log_context
+from adal.token_cache import TokenCache, _parse_expires_on
+
+LOOKUPS = 20000
+
+
+def create_driver():
+    entry = {
+        '_authority': 'https://login.microsoftonline.com/contoso.onmicrosoft.com',
+        '_clientId': 'client',
+        'resource': 'https://graph.windows.net',
+        'userId': 'user@contoso.com',
+        'isMRRT': True,
+        'accessToken': 'access-token',
+        'refreshToken': 'refresh-token',
+        'expiresOn': str(datetime.now() + timedelta(hours=1)),
+        }
+    cache = TokenCache(json.dumps([entry]))
+    return entry['expiresOn'], CacheDriver(
+        {'log_context': create_log_context()}, entry['_authority'], entry['resource'],
+        entry['_clientId'], cache, None)
+
+
+def measure(func):
+    return min(timeit.repeat(func, number=LOOKUPS, repeat=5)) / LOOKUPS * 1e6
+
+
+class _NullFormattingHandler(logging.Handler):
+    def emit(self, record):
+        self.format(record)
+
+
+def measure_hashing(driver, query, level):
+    logger = logging.getLogger(ADAL_LOGGER_NAME)
+    handler = _NullFormattingHandler()
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    hashes = [0]
+    create_token_hash = cache_driver._create_token_hash
+
+    def counting_create_token_hash(token):
+        hashes[0] += 1
+        return create_token_hash(token)
+
+    cache_driver._create_token_hash = counting_create_token_hash
+    try:
+        hit = measure(lambda: driver.find(query))
+        hashes[0] = 0
+        driver.find(query)
+        return hit, hashes[0]
+    finally:
+        cache_driver._create_token_hash = create_token_hash
+        logger.removeHandler(handler)
+        logger.setLevel(logging.ERROR)
+
+
+def main():
+    expires_on, driver = create_driver()
+    query = {'_clientId': 'client', 'userId': 'user@contoso.com'}
+    print('{:<36} {:>8.2f} us'.format('dateutil parse of expiresOn', measure(lambda: parser.parse(expires_on))))
+    print('{:<36} {:>8.2f} us'.format('strptime parse of expiresOn', measure(lambda: _parse_expires_on(expires_on))))
+    for name, level in (('ERROR', logging.ERROR), ('DEBUG', logging.DEBUG)):
+        hit, hashes = measure_hashing(driver, query, level)
+        print('{:<36} {:>8.2f} us, {} token hashes'.format(
+            'CacheDriver.find hit, logging ' + name, hit, hashes))
+
+
+if __name__ == '__main__':
+    main()
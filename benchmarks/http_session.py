@@ -0,0 +1,131 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation. 
+# All rights reserved.
+# 
+# This code is licensed under the MIT License.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+"""Counts the TLS handshakes of token requests, with and without a session.
+
+Usage::
+
+    python benchmarks/http_session.py
+
+A local HTTPS server stands in for the token endpoint and counts the
+connections it accepts. Each acquisition redeems a refresh token, so that
+every call reaches the server. Without a session, every request opened a new
+connection. The pooled session an AuthenticationContext now creates reuses
+one connection.
+"""
+from __future__ import print_function
+
+import json
+import os
+import ssl
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+import adal
+from adal.http_transport import RequestsTransport
+
+ACQUISITIONS = 1000
+CERT_PATH = os.path.join(ROOT, 'tests', 'tls', 'cert.pem')
+KEY_PATH = os.path.join(ROOT, 'tests', 'tls', 'key.pem')
+TOKEN_RESPONSE = json.dumps({
+    'access_token': 'access-token', 'refresh_token': 'refresh-token',
+    'token_type': 'Bearer', 'expires_in': 3600}).encode('utf-8')
+
+
+class _TokenHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self): # pylint: disable=invalid-name
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(TOKEN_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(TOKEN_RESPONSE)
+
+    def log_message(self, *args): # pylint: disable=arguments-differ
+        pass
+
+
+class _StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _TokenHandler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(CERT_PATH, KEY_PATH)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.connections = 0
+
+    def get_request(self):
+        request = HTTPServer.get_request(self)
+        self.connections += 1
+        return request
+
+
+def measure(server, context):
+    server.connections = 0
+    start = time.time()
+    for _ in range(ACQUISITIONS):
+        context.acquire_token_with_refresh_token('refresh-token', 'client', 'resource')
+    return server.connections, (time.time() - start) / ACQUISITIONS * 1e3
+
+
+def main():
+    server = _StandInServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    authority = 'https://127.0.0.1:{}/tenant'.format(server.server_address[1])
+
+    context = adal.AuthenticationContext(
+        authority, validate_authority=False, verify_ssl=CERT_PATH)
+    pooled = measure(server, context)
+    context._call_context['transport'] = RequestsTransport() # pylint: disable=protected-access
+    unpooled = measure(server, context)
+
+    for name, (connections, latency) in (('without a session', unpooled),
+                                         ('with the pooled session', pooled)):
+        print('{:<26} {:>5} handshakes per {} acquisitions, {:.2f} ms each'.format(
+            name, connections, ACQUISITIONS, latency))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+"""Measures TokenCache.find latency as the cache grows.
+
+Usage::
+
+    python benchmarks/token_cache_find.py
+
+Each user owns a handful of entries, so a lookup should cost the same whether
+the cache holds 10 entries or 100k of them.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from adal.token_cache import TokenCache  # pylint: disable=wrong-import-position
+
+RESOURCES_PER_USER = 5
+LOOKUPS = 2000
+
+
+def create_cache(size):
+    entries = []
+    for i in range(size):
+        user = i // RESOURCES_PER_USER
+        entries.append({
+            '_authority': 'https://login.microsoftonline.com/contoso.onmicrosoft.com',
+            '_clientId': 'client-{}'.format(user % 3),
+            'resource': 'https://resource-{}.contoso.com'.format(i % RESOURCES_PER_USER),
+            'userId': 'User{}@contoso.com'.format(user),
+            'isMRRT': True,
+            'accessToken': 'access-token-{}'.format(i),
+            'refreshToken': 'refresh-token-{}'.format(user),
+            'expiresOn': '2099-01-01 00:00:00.000000',
+            })
+    cache = TokenCache()
+    cache.add(entries)
+    return cache
+
+
+def main():
+    print('{:>8} {:>14} {:>14}'.format('entries', 'find (us)', 'mrrt find (us)'))
+    for size in (10, 100, 1000, 10000, 100000):
+        cache = create_cache(size)
+        user = (size // RESOURCES_PER_USER) // 2
+        query = {'_clientId': 'CLIENT-{}'.format(user % 3), 'userId': 'user{}@contoso.com'.format(user)}
+        mrrt_query = dict(query, isMRRT=True)
+        find = min(timeit.repeat(lambda: cache.find(query), number=LOOKUPS, repeat=5))
+        mrrt_find = min(timeit.repeat(lambda: cache.find(mrrt_query), number=LOOKUPS, repeat=5))
+        print('{:>8} {:>14.2f} {:>14.2f}'.format(
+            size, find / LOOKUPS * 1e6, mrrt_find / LOOKUPS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
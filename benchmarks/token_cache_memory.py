@@ -0,0 +1,99 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+"""Measures the memory a TokenCache takes per entry, with and without compact.
+
+Usage::
+
+    python benchmarks/token_cache_memory.py
+
+The cache is loaded from a serialized state of 100k entries, the way an
+application restores a persisted cache. Each entry carries realistic token
+sizes and id token fields. The figures are the bytes allocated while loading
+the cache and still held afterwards, as tracemalloc (Python 3.4+) counts them.
+"""
+from __future__ import print_function
+
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from adal.token_cache import TokenCache  # pylint: disable=wrong-import-position
+
+ENTRIES = 100000
+RESOURCES_PER_USER = 5
+
+
+def create_state():
+    entries = []
+    for i in range(ENTRIES):
+        user = i // RESOURCES_PER_USER
+        entries.append({
+            '_authority': 'https://login.microsoftonline.com/contoso.onmicrosoft.com',
+            '_clientId': '04b07795-8ddb-461a-bbee-02f9e1bf7b46',
+            'resource': 'https://resource-{}.contoso.com/'.format(i % RESOURCES_PER_USER),
+            'userId': 'user{}@contoso.com'.format(user),
+            'isUserIdDisplayable': True,
+            'isMRRT': True,
+            'tokenType': 'Bearer',
+            'expiresIn': 3599,
+            'expiresOn': '2099-01-01 00:00:00.000000',
+            'tenantId': '72f988bf-86f1-41af-91ab-2d7cd011db47',
+            'givenName': 'Given{}'.format(user),
+            'familyName': 'Family{}'.format(user),
+            'oid': '{:08d}-0000-0000-0000-000000000000'.format(user),
+            'accessToken': 'a' * 1400 + str(i),
+            'refreshToken': 'r' * 900 + str(user),
+            })
+    return json.dumps(entries)
+
+
+def measure(state, **kwargs):
+    gc.collect()
+    tracemalloc.start()
+    cache = TokenCache(state, **kwargs)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del cache
+    return size
+
+
+def main():
+    state = create_state()
+    tokens = 1400 + 900 + 2 * 49 # token characters plus the str object headers
+    print('{:<10} {:>16} {:>26}'.format('', 'bytes per entry', 'excluding token strings'))
+    for name, kwargs in (('dict', {}), ('compact', {'compact': True})):
+        per_entry = measure(state, **kwargs) / float(ENTRIES)
+        print('{:<10} {:>16.0f} {:>26.0f}'.format(name, per_entry, per_entry - tokens))
+
+
+if __name__ == '__main__':
+    main()
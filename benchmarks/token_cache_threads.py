@@ -0,0 +1,114 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+"""Measures TokenCache lookup throughput as threads are added.
+
+Usage::
+
+    python benchmarks/token_cache_threads.py
+
+Several threads run lookups against one cache while another thread keeps
+serializing it, the way an application persisting its cache would. The
+default cache takes an exclusive lock for everything. A cache created with
+concurrent_reads=True lets lookups share their lock with each other and with
+serialize().
+
+On CPython the GIL still runs one thread at a time. What the shared lock saves
+is the time lookups spend queued behind each other and behind serialize().
+Lookups that do I/O, such as logging to a file, or builds without a GIL gain
+more.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from token_cache_find import RESOURCES_PER_USER  # pylint: disable=wrong-import-position
+from adal.token_cache import TokenCache  # pylint: disable=wrong-import-position
+
+ENTRIES = 20000
+DURATION = 1.0
+
+
+def create_cache(concurrent_reads):
+    cache = TokenCache(concurrent_reads=concurrent_reads)
+    cache.add([{
+        '_authority': 'https://login.microsoftonline.com/contoso.onmicrosoft.com',
+        '_clientId': 'client',
+        'resource': 'https://resource-{}.contoso.com'.format(i % RESOURCES_PER_USER),
+        'userId': 'user{}@contoso.com'.format(i // RESOURCES_PER_USER),
+        'isMRRT': True,
+        'accessToken': 'access-token-{}'.format(i),
+        'refreshToken': 'refresh-token',
+        'expiresOn': '2099-01-01 00:00:00.000000',
+        } for i in range(ENTRIES)])
+    return cache
+
+
+def measure(cache, thread_count):
+    stop = threading.Event()
+    counts = [0] * thread_count
+
+    def lookup(index):
+        query = {'_clientId': 'client'}
+        users = ENTRIES // RESOURCES_PER_USER
+        n = 0
+        while not stop.is_set():
+            query['userId'] = 'user{}@contoso.com'.format((n * 7919 + index) % users)
+            cache.find(query)
+            n += 1
+        counts[index] = n
+
+    def persist():
+        while not stop.is_set():
+            cache.serialize()
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=lookup, args=(i,)) for i in range(thread_count)]
+    threads.append(threading.Thread(target=persist))
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / DURATION
+
+
+def main():
+    print('{:>8} {:>18} {:>18}'.format('threads', 'exclusive (ops/s)', 'shared (ops/s)'))
+    exclusive, shared = create_cache(False), create_cache(True)
+    for thread_count in (1, 2, 4, 8, 16):
+        print('{:>8} {:>18.0f} {:>18.0f}'.format(
+            thread_count, measure(exclusive, thread_count), measure(shared, thread_count)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation. 
+# All rights reserved.
+# 
+# This code is licensed under the MIT License.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+from datetime import datetime, timedelta
+import json
+import ssl
+import unittest
+
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+import six
+
+import adal
+try:
+    import asyncio
+    from adal import aio
+except (ImportError, SyntaxError): # Python 2
+    aio = None
+from tests import util
+from tests.util import parameters as cp
+
+
+class _StandInServer(object):
+    '''Answers each HTTP request on a connection with handler(method, path,
+    form), a (status, JSON document) pair, then closes the connection.'''
+
+    def __init__(self, handler, requests):
+        self._handler = handler
+        self._requests = requests
+        self._transport = None
+        self._buffer = b''
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def data_received(self, data):
+        self._buffer += data
+        head, separator, body = self._buffer.partition(b'\r\n\r\n')
+        if not separator:
+            return
+        lines = head.decode('latin-1').split('\r\n')
+        method, path, _ = lines[0].split(' ')
+        headers = dict((name.strip().lower(), value.strip())
+                       for name, _, value in (line.partition(':') for line in lines[1:]))
+        if len(body) < int(headers.get('content-length', 0)):
+            return
+        form = dict((k, v[0]) for k, v in parse_qs(body.decode('utf-8')).items())
+        self._requests.append((method, path, form))
+        status, document = self._handler(method, path, form)
+        payload = json.dumps(document).encode('utf-8')
+        self._transport.write(
+            'HTTP/1.1 {} Stand-in\r\nContent-Type: application/json\r\n'
+            'Content-Length: {}\r\n\r\n'.format(status, len(payload)).encode('latin-1') + payload)
+        self._transport.close()
+
+    def connection_lost(self, exc):
+        pass
+
+    def eof_received(self):
+        pass
+
+
+@unittest.skipIf(aio is None, 'adal.aio needs Python 3.5 or later')
+class TestAsyncAuthenticationContext(unittest.TestCase):
+    def setUp(self):
+        server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_context.load_cert_chain(util.tls_cert_path, util.tls_key_path)
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.requests = []
+        self.response = (200, {
+            'access_token': 'new AT', 'refresh_token': 'new RT', 'token_type': 'Bearer',
+            'expires_in': 3600, 'resource': cp['resource']})
+        self.server = self.loop.run_until_complete(self.loop.create_server(
+            lambda: _StandInServer(lambda *_: self.response, self.requests),
+            '127.0.0.1', 0, ssl=server_context))
+        self.authority = 'https://127.0.0.1:{}/{}'.format(
+            self.server.sockets[0].getsockname()[1], cp['tenant'])
+        self.context = aio.AsyncAuthenticationContext(
+            self.authority, validate_authority=False, verify_ssl=util.tls_cert_path)
+
+    def tearDown(self):
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def _run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_client_credentials(self):
+        token = self._run(self.context.acquire_token_with_client_credentials(
+            cp['resource'], cp['clientId'], cp['clientSecret']))
+        self.assertEqual('new AT', token['accessToken'])
+        self.assertEqual(1, len(self.requests))
+        method, path, form = self.requests[0]
+        self.assertEqual(('POST', '/{}/oauth2/token'.format(cp['tenant'])), (method, path))
+        self.assertEqual('client_credentials', form['grant_type'])
+
+        # The token is cached, for this context and for others sharing the cache
+        self._run(self.context.acquire_token_with_client_credentials(
+            cp['resource'], cp['clientId'], cp['clientSecret']))
+        context = adal.AuthenticationContext(
+            self.authority, validate_authority=False, cache=self.context.cache)
+        self.assertEqual('new AT', context.acquire_token(
+            cp['resource'], None, cp['clientId'])['accessToken'])
+        self.assertEqual(1, len(self.requests))
+
+    def test_retries_server_errors(self):
+        self.response = (503, {})
+        context = aio.AsyncAuthenticationContext(
+            self.authority, validate_authority=False, verify_ssl=util.tls_cert_path,
+            retry_policy=adal.RetryPolicy(max_retries=2, base_delay=0.01, max_delay=0.01))
+
+        with six.assertRaisesRegex(self, adal.AdalError, 'http error: 503'):
+            self._run(context.acquire_token_with_client_credentials(
+                cp['resource'], cp['clientId'], cp['clientSecret']))
+        self.assertEqual(3, len(self.requests))
+
+    def test_concurrent_callers_share_one_refresh(self):
+        self.context.cache.add([{
+            '_authority': self.authority, '_clientId': cp['clientId'],
+            'resource': cp['resource'], 'userId': cp['username'], 'isMRRT': True,
+            'accessToken': 'old AT', 'refreshToken': 'old RT',
+            'expiresOn': str(datetime.now() - timedelta(hours=1)),
+            }])
+
+        tokens = self._run(asyncio.gather(*[
+            self.context.acquire_token(cp['resource'], cp['username'], cp['clientId'])
+            for _ in range(20)]))
+
+        self.assertEqual(['new AT'] * 20, [token['accessToken'] for token in tokens])
+        self.assertEqual(1, len(self.requests))
+        form = self.requests[0][2]
+        self.assertEqual(('refresh_token', 'old RT'), (form['grant_type'], form['refresh_token']))
+        self.assertEqual('new RT', self.context.cache.find({})[0]['refreshToken'])
+
+    def test_http_error(self):
+        self.response = (400, {'error': 'invalid_client'})
+        with six.assertRaisesRegex(self, adal.AdalError, 'Get Token request returned http error: 400'):
+            self._run(self.context.acquire_token_with_client_credentials(
+                cp['resource'], cp['clientId'], cp['clientSecret']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,7 +25,10 @@
 #
 #------------------------------------------------------------------------------
 
+import os
+import shutil
 import sys
+import tempfile
 import requests
 import httpretty
 import six
@@ -42,6 +45,7 @@ except ImportError:
 
 import adal
 from adal.authority import Authority
+from adal.instance_discovery_cache import InstanceDiscoveryCache
 from adal import log
 from adal.authentication_context import AuthenticationContext
 from tests import util
@@ -99,6 +103,68 @@ class TestAuthority(unittest.TestCase):
             'The response does not match what was expected.: ' + str(token_response)
         )
 
+    @httpretty.activate
+    def test_dynamic_instance_discovery_is_shared_across_contexts(self):
+        util.setup_expected_instance_discovery_request(
+            200,
+            cp['authorityHosts']['global'],
+            {'tenant_discovery_endpoint' : 'http://foobar'},
+            self.nonHardCodedAuthorizeEndpoint
+        )
+        response = util.create_response({ 'authority' : self.nonHardCodedAuthority })
+        util.setup_expected_client_cred_token_request_response(
+            200, response['wireResponse'], self.nonHardCodedAuthority)
+
+        for _ in range(2):
+            context = adal.AuthenticationContext(self.nonHardCodedAuthority)
+            context.acquire_token_with_client_credentials(
+                 response['resource'], cp['clientId'], cp['clientSecret'])
+
+        discoveries = [request for request in httpretty.latest_requests()
+                       if 'discovery/instance' in request.path]
+        self.assertEqual(1, len(discoveries))
+
+    @httpretty.activate
+    def test_unwritable_instance_discovery_cache_does_not_fail_acquisition(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache = InstanceDiscoveryCache(path=os.path.join(directory, 'missing', 'discovery.json'))
+        previous_cache = adal.get_instance_discovery_cache()
+        adal.set_instance_discovery_cache(cache)
+        self.addCleanup(adal.set_instance_discovery_cache, previous_cache)
+        util.setup_expected_instance_discovery_request(
+            200,
+            cp['authorityHosts']['global'],
+            {'tenant_discovery_endpoint' : 'http://foobar'},
+            self.nonHardCodedAuthorizeEndpoint
+        )
+        response = util.create_response({ 'authority' : self.nonHardCodedAuthority })
+        util.setup_expected_client_cred_token_request_response(
+            200, response['wireResponse'], self.nonHardCodedAuthority)
+
+        context = adal.AuthenticationContext(self.nonHardCodedAuthority)
+        token_response = context.acquire_token_with_client_credentials(
+             response['resource'], cp['clientId'], cp['clientSecret'])
+
+        self.assertEqual(response['wireResponse']['access_token'], token_response['accessToken'])
+        self.assertEqual('http://foobar', cache.get('login.doesntexist.com', cp['tenant']))
+
+    def test_instance_discovery_cache_persists_unexpired_entries(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'discovery.json')
+
+        InstanceDiscoveryCache(path=path).add('login.doesntexist.com', cp['tenant'], 'http://foobar')
+        InstanceDiscoveryCache(ttl=0, path=path).add('login.expired.com', cp['tenant'], 'http://foobar')
+
+        cache = InstanceDiscoveryCache(path=path)
+        self.assertEqual('http://foobar', cache.get('LOGIN.doesntexist.com', cp['tenant']))
+        self.assertIsNone(cache.get('login.expired.com', cp['tenant']))
+
+        with open(path, 'w') as cache_file:
+            cache_file.write('not json')
+        self.assertIsNone(InstanceDiscoveryCache(path=path).get('login.doesntexist.com', cp['tenant']))
+
     def performStaticInstanceDiscovery(self, authorityHost):
         hardCodedAuthority = 'https://' + authorityHost + '/' + cp['tenant']
 
@@ -25,14 +25,23 @@
 #
 #------------------------------------------------------------------------------
 
+from datetime import datetime, timedelta
+import logging
+import threading
+import time
 import unittest
 try:
     from unittest import mock
 except ImportError:
     import mock
 
+import adal
+from adal import log
 from adal.log import create_log_context
+from adal.adal_error import AdalError
+from adal import cache_driver
 from adal.cache_driver import CacheDriver
+from adal.token_cache import TokenCache
 
 
 class TestCacheDriver(unittest.TestCase):
@@ -56,3 +65,340 @@ class TestCacheDriver(unittest.TestCase):
         refresh_function.assert_not_called()  # Otherwise it will cause an exception
         self.assertIsNone(entry)
 
+
+class TestCacheDriverSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.cache = TokenCache()
+        self.cache.add([{
+            "_authority": "authority",
+            "_clientId": "client_id",
+            "resource": "resource",
+            "userId": "user",
+            "isMRRT": True,
+            "accessToken": "expired AT",
+            "refreshToken": "RT",
+            "expiresOn": str(datetime.now() - timedelta(hours=1)),
+            }])
+        self.release = threading.Event()
+        self.calls = []
+
+    def _refresh(self, entry, resource):
+        self.calls.append(resource)
+        self.release.wait(5)
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response
+
+    def _find_concurrently(self, resource, callers=5):
+        results = []
+        def find():
+            driver = CacheDriver(
+                {"log_context": create_log_context()}, "authority", resource,
+                "client_id", self.cache, self._refresh)
+            try:
+                results.append(driver.find({"userId": "user", "_clientId": "client_id"}))
+            except Exception as exp:  # pylint: disable=broad-except
+                results.append(exp)
+        threads = [threading.Thread(target=find) for _ in range(callers)]
+        for t in threads:
+            t.start()
+        # Let every caller find the expired entry before the refresh completes
+        time.sleep(0.2)
+        self.release.set()
+        for t in threads:
+            t.join(5)
+        return results
+
+    def _response(self, access_token):
+        return {
+            "accessToken": access_token,
+            "refreshToken": "new RT",
+            "expiresOn": str(datetime.now() + timedelta(hours=1)),
+            }
+
+    def test_concurrent_refreshes_of_an_entry_are_coalesced(self):
+        self.response = self._response("new AT")
+        results = self._find_concurrently("resource")
+        self.assertEqual([None], self.calls)
+        self.assertEqual(["new AT"] * 5, [r["accessToken"] for r in results])
+
+    def test_concurrent_mrrt_redemptions_are_coalesced(self):
+        self.response = self._response("other AT")
+        results = self._find_concurrently("other resource")
+        self.assertEqual(["other resource"], self.calls)
+        self.assertEqual(["other AT"] * 5, [r["accessToken"] for r in results])
+
+    def test_refresh_error_is_shared(self):
+        self.response = ValueError("refresh failed")
+        results = self._find_concurrently("resource")
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual([self.response] * 5, results)
+
+    def test_later_caller_reuses_refreshed_entry(self):
+        stale_entry = self.cache.find({})[0]
+        self.response = self._response("new AT")
+        self.release.set()
+        driver = CacheDriver(
+            {"log_context": create_log_context()}, "authority", "resource",
+            "client_id", self.cache, self._refresh)
+        driver._refresh_expired_entry(stale_entry)
+        self.assertEqual("new AT", driver._refresh_expired_entry(stale_entry)["accessToken"])
+        self.assertEqual(1, len(self.calls))
+
+
+class TestCacheDriverReplace(unittest.TestCase):
+    def setUp(self):
+        self.expired = {
+            "_authority": "authority", "_clientId": "client_id", "resource": "resource",
+            "userId": "user", "isMRRT": True, "accessToken": "expired AT", "refreshToken": "RT",
+            "expiresOn": str(datetime.now() - timedelta(hours=1)),
+            }
+        self.other = dict(self.expired, resource="other resource", accessToken="other AT",
+                          expiresOn=str(datetime.now() + timedelta(hours=1)))
+        self.refresh_function = mock.MagicMock(return_value={
+            "accessToken": "new AT", "refreshToken": "new RT",
+            "expiresOn": str(datetime.now() + timedelta(hours=1)),
+            })
+
+    def _find(self, cache):
+        driver = CacheDriver(
+            {"log_context": create_log_context()}, "authority", "resource",
+            "client_id", cache, self.refresh_function)
+        return driver.find({"userId": "user", "_clientId": "client_id"})
+
+    def test_refresh_is_stored_in_one_replace(self):
+        cache = TokenCache()
+        cache.add([self.expired, self.other])
+        found = cache.find({})
+        with mock.patch.object(cache, 'replace', wraps=cache.replace) as replace:
+            self.assertEqual("new AT", self._find(cache)["accessToken"])
+        replace.assert_called_once_with(
+            [self.expired], [dict(self.other, refreshToken="new RT"), mock.ANY])
+        self.assertEqual(["new RT", "new RT"], [e["refreshToken"] for e in cache.find({})])
+        # Cached entries are replaced, never changed in place outside the lock
+        self.assertEqual(["RT", "RT"], [e["refreshToken"] for e in found])
+
+    def test_refreshed_entry_is_found_again(self):
+        for cache in (TokenCache(), TokenCache(capacity=10)):
+            self.refresh_function.reset_mock()
+            source = TokenCache()
+            source.add([self.expired])
+            cache.deserialize(source.serialize())
+            self.assertEqual("new AT", self._find(cache)["accessToken"])
+            self.assertEqual("new AT", self._find(cache)["accessToken"])
+            self.assertEqual(1, self.refresh_function.call_count)
+
+    def test_cache_without_replace(self):
+        cache = mock.MagicMock(spec=['find', 'add', 'remove'])
+        cache.find.side_effect = [[self.expired], [self.expired, self.other], [self.expired, self.other]]
+        self.assertEqual("new AT", self._find(cache)["accessToken"])
+        cache.remove.assert_called_once_with([self.expired])
+        cache.add.assert_called_once_with([dict(self.other, refreshToken="new RT"), mock.ANY])
+        self.assertEqual("RT", self.other["refreshToken"])
+
+
+class TestCacheDriverLogging(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger(log.ADAL_LOGGER_NAME)
+        self.level = self.logger.level
+        self.cache = TokenCache()
+        self.cache.add([{
+            "_authority": "authority", "_clientId": "client_id", "resource": "resource",
+            "userId": "user", "isMRRT": True, "accessToken": "AT", "refreshToken": "RT",
+            "expiresOn": str(datetime.now() + timedelta(hours=1)),
+            }])
+
+    def tearDown(self):
+        self.logger.setLevel(self.level)
+
+    def _find(self):
+        driver = CacheDriver(
+            {"log_context": create_log_context()}, "authority", "resource",
+            "client_id", self.cache, None)
+        return driver.find({"userId": "user"})
+
+    def test_tokens_are_not_hashed_when_debug_logging_is_off(self):
+        self.logger.setLevel(logging.ERROR)
+        with mock.patch('adal.cache_driver._create_token_hash') as create_token_hash:
+            self.assertEqual("AT", self._find()["accessToken"])
+        create_token_hash.assert_not_called()
+
+    def test_token_hashes_are_logged_when_debug_logging_is_on(self):
+        self.logger.setLevel(logging.DEBUG)
+        records = []
+        handler = logging.Handler()
+        handler.emit = lambda record: records.append(record.getMessage())
+        self.logger.addHandler(handler)
+        try:
+            self._find()
+        finally:
+            self.logger.removeHandler(handler)
+        self.assertTrue(any('AccessTokenId: ' in r and 'RefreshTokenId: ' in r for r in records))
+
+
+class TestCacheDriverStaleWhileRevalidate(unittest.TestCase):
+    def setUp(self):
+        self.cache = TokenCache()
+        self.refreshed = threading.Event()
+        self.release = threading.Event()
+        self.calls = []
+        self.error = None
+
+    def tearDown(self):
+        cache_driver._background_refreshes.clear()
+
+    def _add_entry(self, expires_in):
+        self.cache.add([{
+            "_authority": "authority", "_clientId": "client_id", "resource": "resource",
+            "userId": "user", "isMRRT": True, "accessToken": "old AT", "refreshToken": "RT",
+            "expiresOn": str(datetime.now() + expires_in),
+            }])
+
+    def _refresh(self, entry, resource):
+        self.calls.append(resource)
+        self.release.wait(5)
+        self.refreshed.set()
+        if self.error:
+            raise self.error
+        return {"accessToken": "new AT", "refreshToken": "new RT",
+                "expiresOn": str(datetime.now() + timedelta(hours=1))}
+
+    def _find(self):
+        driver = CacheDriver(
+            {"log_context": create_log_context(), "stale_while_revalidate": True},
+            "authority", "resource", "client_id", self.cache, self._refresh)
+        return driver.find({"userId": "user"})["accessToken"]
+
+    def _wait_for_cached_token(self, access_token):
+        for _ in range(500):
+            if self.cache.find({})[0]["accessToken"] == access_token:
+                return
+            time.sleep(0.01)
+        self.fail("The cache was not updated")
+
+    def test_expiring_token_is_returned_and_refreshed_in_background(self):
+        self._add_entry(timedelta(minutes=2))
+        self.assertEqual("old AT", self._find())
+        self.assertEqual("old AT", self._find())
+        self.release.set()
+        self._wait_for_cached_token("new AT")
+        self.assertEqual([None], self.calls)
+        self.assertEqual("new AT", self._find())
+
+    def test_expired_token_is_refreshed_in_foreground(self):
+        self._add_entry(-timedelta(minutes=1))
+        self.release.set()
+        self.assertEqual("new AT", self._find())
+
+    def test_failed_background_refresh_is_not_retried_immediately(self):
+        self._add_entry(timedelta(minutes=2))
+        self.error = ValueError("refresh failed")
+        self.release.set()
+        self.assertEqual("old AT", self._find())
+        self.assertTrue(self.refreshed.wait(5))
+        for _ in range(500):
+            if cache_driver._background_refreshes and \
+                    list(cache_driver._background_refreshes.values())[0] != float('inf'):
+                break
+            time.sleep(0.01)
+        self.assertEqual("old AT", self._find())
+        self.assertEqual(1, len(self.calls))
+
+
+    def test_failed_refreshes_are_pruned_and_capped(self):
+        self._add_entry(timedelta(minutes=2))
+        key = (id(self.cache), cache_driver._get_cache_key(self.cache.find({})[0]))
+        for index in range(5):
+            cache_driver._background_refreshes[(0, index)] = time.time() + 60
+        cache_driver._background_refreshes[key] = time.time() - 1 # Its retry delay has passed
+        self.release.set()
+
+        with mock.patch.object(cache_driver, '_BACKGROUND_REFRESH_CACHE_SIZE', 3):
+            self.assertEqual("old AT", self._find())
+            self.assertLessEqual(len(cache_driver._background_refreshes), 3)
+            self._wait_for_cached_token("new AT")
+        for _ in range(500):
+            if key not in cache_driver._background_refreshes:
+                break
+            time.sleep(0.01)
+        self.assertNotIn(key, cache_driver._background_refreshes)
+
+class TestCacheDriverInvalidGrant(unittest.TestCase):
+    def setUp(self):
+        self.cache = TokenCache()
+        self.error = AdalError("Get Token request returned http error: 400", {"error": "invalid_grant"})
+        self.refresh_function = mock.MagicMock(side_effect=self.error)
+
+    def tearDown(self):
+        cache_driver._invalid_grants.clear()
+
+    def _find(self, refresh_token="RT"):
+        self.cache.add([{
+            "_authority": "authority", "_clientId": "client_id", "resource": "resource",
+            "userId": "user", "isMRRT": True, "accessToken": "AT", "refreshToken": refresh_token,
+            "expiresOn": str(datetime.now() - timedelta(hours=1)),
+            }])
+        driver = CacheDriver(
+            {"log_context": create_log_context()}, "authority", "resource",
+            "client_id", self.cache, self.refresh_function)
+        return driver.find({"userId": "user"})
+
+    def test_rejected_refresh_token_is_not_sent_again(self):
+        for _ in range(3):
+            with self.assertRaises(AdalError) as context:
+                self._find()
+            self.assertIs(self.error, context.exception)
+        self.assertEqual(1, self.refresh_function.call_count)
+
+    def test_other_refresh_token_is_sent(self):
+        self.assertRaises(AdalError, self._find)
+        self.assertRaises(AdalError, self._find, "new RT")
+        self.assertEqual(2, self.refresh_function.call_count)
+
+    def test_rejection_expires(self):
+        with mock.patch.object(cache_driver, 'INVALID_GRANT_CACHE_TTL', 0):
+            self.assertRaises(AdalError, self._find)
+            self.assertRaises(AdalError, self._find)
+        self.assertEqual(2, self.refresh_function.call_count)
+
+    def test_other_errors_are_not_remembered(self):
+        self.refresh_function.side_effect = AdalError("Get Token request returned http error: 500")
+        self.assertRaises(AdalError, self._find)
+        self.assertRaises(AdalError, self._find)
+        self.assertEqual(2, self.refresh_function.call_count)
+
+
+class TestFindUnexpiredEntry(unittest.TestCase):
+    def setUp(self):
+        self.cache = TokenCache()
+
+    def _add_entry(self, expires_in, user="user", resource="resource"):
+        self.cache.add([{
+            "_authority": "https://login.microsoftonline.com/tenant", "_clientId": "client_id",
+            "resource": resource, "userId": user, "isMRRT": True, "accessToken": "AT",
+            "refreshToken": "RT", "expiresOn": str(datetime.now() + expires_in),
+            }])
+
+    def _find(self, user="user", resource="resource"):
+        return cache_driver.find_unexpired_entry(
+            self.cache, "https://login.microsoftonline.com/tenant", resource, "client_id", user)
+
+    def test_returns_unexpired_entry(self):
+        self._add_entry(timedelta(hours=1))
+        self.assertEqual("AT", self._find()["accessToken"])
+
+    def test_skips_entries_that_need_the_full_lookup(self):
+        self._add_entry(timedelta(minutes=1))
+        self.assertIsNone(self._find())  # Within the clock buffer
+        self.assertIsNone(self._find(resource="other resource"))  # MRRT redemption
+        self._add_entry(timedelta(hours=1), user="other user")
+        self.assertIsNone(self._find(user=None))  # Ambiguous
+
+    def test_acquire_token_hit_skips_the_token_request(self):
+        self._add_entry(timedelta(hours=1))
+        context = adal.AuthenticationContext(
+            "https://login.microsoftonline.com/tenant", validate_authority=False, cache=self.cache)
+        with mock.patch("adal.authentication_context.TokenRequest") as token_request:
+            token = context.acquire_token("resource", "user", "client_id")
+        token_request.assert_not_called()
+        self.assertEqual("AT", token["accessToken"])
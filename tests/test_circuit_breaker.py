@@ -0,0 +1,144 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+import json
+import unittest
+
+import requests
+import six
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import adal
+from adal.circuit_breaker import CircuitBreaker
+from adal.http_transport import HttpTransport
+from tests import util
+from tests.util import parameters as cp
+
+
+class _Response(object):
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.headers = {}
+        self.text = json.dumps(body or {})
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class _OutageTransport(HttpTransport):
+    '''Fails every request while down, and returns a token otherwise.'''
+
+    def __init__(self):
+        self.down = True
+        self.sent = 0
+
+    def send(self, method, url, headers=None, data=None, timeout=None, verify=None,
+             proxies=None):
+        self.sent += 1
+        if self.down:
+            raise requests.exceptions.ConnectTimeout('Connection to the host timed out')
+        return _Response(200, {
+            'access_token': 'new AT', 'token_type': 'Bearer', 'expires_in': 3600})
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        util.reset_logging()
+        util.clear_static_cache()
+        self.now = 1000.0
+        patcher = mock.patch('adal.circuit_breaker._now', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        util.reset_logging()
+        util.clear_static_cache()
+
+    def test_opens_after_consecutive_failures_and_probes_after_reset_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        transport = _OutageTransport()
+        context = adal.AuthenticationContext(
+            cp['authUrl'], validate_authority=False, transport=transport,
+            circuit_breaker=breaker)
+
+        def acquire():
+            return context.acquire_token_with_client_credentials(
+                cp['resource'], cp['clientId'], cp['clientSecret'])
+
+        for _ in range(2):
+            self.assertRaises(requests.exceptions.ConnectTimeout, acquire)
+        with six.assertRaisesRegex(self, adal.AdalError, 'failing fast'):
+            acquire()
+        self.assertEqual(2, transport.sent)
+        self.assertEqual({'login.microsoftonline.com': {
+            'state': 'open', 'consecutive_failures': 2,
+            'requests': 2, 'failures': 2, 'rejected': 1}}, breaker.stats())
+
+        # A failed probe opens the circuit again
+        self.now += 30
+        self.assertRaises(requests.exceptions.ConnectTimeout, acquire)
+        self.assertRaises(adal.AdalError, acquire)
+        self.assertEqual(3, transport.sent)
+
+        # A successful probe closes it
+        self.now += 30
+        transport.down = False
+        self.assertEqual('new AT', acquire()['accessToken'])
+        self.assertEqual('closed', breaker.stats()['login.microsoftonline.com']['state'])
+
+    def test_only_one_probe_at_a_time(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.before_request('adfs.contoso.com')
+        breaker.record('adfs.contoso.com', response=_Response(503))
+
+        self.now += 30
+        breaker.before_request('adfs.contoso.com')
+        self.assertRaises(adal.AdalError, breaker.before_request, 'adfs.contoso.com')
+        self.assertEqual('half_open', breaker.stats()['adfs.contoso.com']['state'])
+        # Nor does a probe which never reported back hold it forever
+        self.now += 30
+        breaker.before_request('adfs.contoso.com')
+
+    def test_hosts_have_their_own_circuits(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.before_request('adfs.contoso.com')
+        breaker.record('adfs.contoso.com', error=requests.exceptions.ConnectionError())
+        breaker.before_request('login.microsoftonline.com')
+        breaker.record('login.microsoftonline.com', response=_Response(400))
+
+        self.assertRaises(adal.AdalError, breaker.before_request, 'adfs.contoso.com')
+        breaker.before_request('login.microsoftonline.com')
+        self.assertEqual('closed', breaker.stats()['login.microsoftonline.com']['state'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,11 +25,19 @@
 #
 #------------------------------------------------------------------------------
 
+from datetime import datetime, timedelta
 import unittest
 import json
+import threading
 import httpretty
+import requests
 import six
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
 import adal
 from adal.self_signed_jwt import SelfSignedJwt
 from adal.authentication_context import AuthenticationContext
@@ -59,6 +67,22 @@ class TestClientCredentials(unittest.TestCase):
             'The response does not match what was expected.: ' + str(token_response)
         )
 
+    @httpretty.activate
+    def test_requests_go_through_the_session(self):
+        response = util.create_response({ 'noRefresh' : True, 'tokenEndpoint': True })
+        util.setup_expected_client_cred_token_request_response(200, response['wireResponse'])
+        session = requests.Session()
+        session.request = mock.MagicMock(side_effect=session.request)
+        session.close = mock.MagicMock()
+
+        context = adal.AuthenticationContext(cp['authUrl'], session=session)
+        context.acquire_token_with_client_credentials(
+             response['resource'], cp['clientId'], cp['clientSecret'])
+        context.close()
+
+        self.assertEqual(1, session.request.call_count)
+        session.close.assert_not_called() # The context only closes a session it created
+
     @httpretty.activate
     def test_http_error(self):
         tokenRequest = util.setup_expected_client_cred_token_request_response(403)
@@ -114,6 +138,65 @@ class TestClientCredentials(unittest.TestCase):
             self.assertTrue(err, 'Expected an error and non was received.')
             self.assertIn('not found', err.args[0], 'Returned error did not contain expected message: ' + err.args[0])
 
+    def test_concurrent_calls_keep_their_own_call_context(self):
+        context = AuthenticationContext(cp['authUrl'], validate_authority=False)
+        entered = []
+        both_entered = threading.Event()
+
+        class FakeTokenRequest(object):
+            def __init__(self, call_context, *args):
+                self.call_context = call_context
+
+            def get_token_with_client_credentials(self, client_secret):
+                correlation_id = self.call_context['log_context']['correlation_id']
+                entered.append(correlation_id)
+                if len(entered) == 2:
+                    both_entered.set()
+                both_entered.wait(5)
+                return self.call_context['log_context']['correlation_id']
+
+        results = []
+        def acquire():
+            results.append(context.acquire_token_with_client_credentials(
+                cp['resource'], cp['clientId'], cp['clientSecret']))
+
+        with mock.patch('adal.authentication_context.TokenRequest', FakeTokenRequest):
+            threads = [threading.Thread(target=acquire) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(sorted(entered), sorted(results))
+        self.assertNotEqual(results[0], results[1])
+        self.assertNotIn('log_context', context._call_context)
+
+    def test_batch_serves_cache_hits_and_requests_misses(self):
+        context = AuthenticationContext(cp['authUrl'], validate_authority=False)
+        context.cache.add([{
+            '_authority': cp['authUrl'], '_clientId': cp['clientId'], 'resource': 'cached',
+            'accessToken': 'cached AT', 'expiresOn': str(datetime.now() + timedelta(hours=1)),
+            }])
+        requested = []
+
+        class FakeTokenRequest(object):
+            def __init__(self, call_context, authentication_context, client_id, resource):
+                self.resource = resource
+
+            def get_token_with_client_credentials(self, client_secret):
+                requested.append(self.resource)
+                if self.resource == 'bad':
+                    raise adal.AdalError('Get Token request returned http error: 400')
+                return {'accessToken': self.resource + ' AT'}
+
+        with mock.patch('adal.authentication_context.TokenRequest', FakeTokenRequest):
+            results = context.acquire_tokens_with_client_credentials(
+                ['cached', 'good', 'bad', 'good'], cp['clientId'], cp['clientSecret'], max_workers=2)
+
+        self.assertEqual(['bad', 'good'], sorted(requested))
+        self.assertEqual('cached AT', results['cached']['accessToken'])
+        self.assertEqual('good AT', results['good']['accessToken'])
+        self.assertIsInstance(results['bad'], adal.AdalError)
 
     def update_self_signed_jwt_stubs():
         '''
@@ -0,0 +1,121 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from adal.file_token_cache import FileTokenCache
+from adal.token_cache import TokenCache
+from tests.test_token_cache import _create_entry
+
+
+class TestFileTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tokens.json')
+        self.alice = _create_entry("alice@contoso.com", "graph")
+        self.bob = _create_entry("bob@contoso.com", "graph")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_changes_are_written_to_the_file(self):
+        cache = FileTokenCache(self.path)
+        cache.add([self.alice, self.bob])
+        cache.remove([self.bob])
+        self.assertFalse(cache.has_state_changed)
+        with open(self.path) as cache_file:
+            persisted = TokenCache(cache_file.read())
+        self.assertEqual([self.alice], persisted.find({}))
+
+    def test_other_instances_see_changes(self):
+        worker1 = FileTokenCache(self.path)
+        worker2 = FileTokenCache(self.path)
+        worker1.add([self.alice])
+        self.assertEqual([self.alice], worker2.find({"userId": "alice@contoso.com"}))
+
+        worker2.add([self.bob])
+        worker1.remove([self.alice])
+        self.assertEqual([self.bob], worker2.find({}))
+        self.assertEqual([self.bob], worker1.find({}))
+
+    def test_find_only_reloads_when_the_file_changed(self):
+        FileTokenCache(self.path).add([self.alice])
+        cache = FileTokenCache(self.path)
+        with mock.patch.object(cache, 'deserialize', wraps=cache.deserialize) as deserialize:
+            for _ in range(3):
+                cache.find({"userId": "alice@contoso.com"})
+            deserialize.assert_not_called()
+
+            FileTokenCache(self.path).add([self.bob])
+            cache.find({})
+            cache.find({})
+            self.assertEqual(1, deserialize.call_count)
+
+    def test_replace_writes_the_file_once(self):
+        cache = FileTokenCache(self.path)
+        cache.add([self.alice])
+        with mock.patch.object(cache, 'serialize', wraps=cache.serialize) as serialize:
+            cache.replace([self.alice], [self.bob])
+            self.assertEqual(1, serialize.call_count)
+        self.assertEqual([self.bob], FileTokenCache(self.path).find({}))
+
+    def test_refresh_tokens_are_updated_under_one_exclusive_lock(self):
+        FileTokenCache(self.path).add([self.alice])
+        cache = FileTokenCache(self.path)
+        # Another worker rotates the entries after this one last read them
+        FileTokenCache(self.path).add([dict(self.alice, accessToken="other AT")])
+        alice_mail = dict(_create_entry("alice@contoso.com", "mail"), refreshToken="new RT")
+
+        with mock.patch.object(cache, '_file_lock', wraps=cache._file_lock) as file_lock:
+            updated = cache.update_refresh_tokens(
+                {"isMRRT": True, "userId": "alice@contoso.com", "_clientId": "client_id"},
+                "new RT", [], [alice_mail])
+        file_lock.assert_called_once_with(exclusive=True)
+
+        self.assertEqual([dict(self.alice, accessToken="other AT", refreshToken="new RT")], updated)
+        found = FileTokenCache(self.path).find({"userId": "alice@contoso.com"})
+        self.assertEqual(sorted(["other AT", alice_mail["accessToken"]]),
+                         sorted(e["accessToken"] for e in found))
+
+    def test_remove_of_missing_entry_does_not_rewrite_the_file(self):
+        cache = FileTokenCache(self.path)
+        cache.add([self.alice])
+        signature = cache._get_file_signature()
+        cache.remove([self.bob])
+        self.assertEqual(signature, cache._get_file_signature())
+
+
+if __name__ == '__main__':
+    unittest.main()
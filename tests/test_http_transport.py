@@ -0,0 +1,179 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+import json
+import unittest
+
+import requests
+import six
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import adal
+from adal.http_transport import HttpTransport
+from tests import util
+from tests.util import parameters as cp
+
+
+class _Response(object):
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.headers = {}
+        self.text = json.dumps(body)
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        raise requests.exceptions.HTTPError(str(self.status_code))
+
+
+class _InProcessTransport(HttpTransport):
+    '''Answers every request with the next of responses.'''
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def send(self, method, url, headers=None, data=None, timeout=None, verify=None,
+             proxies=None):
+        self.requests.append((method, url, timeout))
+        return self.responses.pop(0)
+
+
+class _SlowTransport(_InProcessTransport):
+    '''Takes latency seconds, of the clock of the test, to answer.'''
+
+    def __init__(self, test, latency, *responses):
+        super(_SlowTransport, self).__init__(*responses)
+        self.test = test
+        self.latency = latency
+
+    def send(self, *args, **kwargs):
+        self.test.now += self.latency
+        return super(_SlowTransport, self).send(*args, **kwargs)
+
+
+class TestHttpTransport(unittest.TestCase):
+
+    def setUp(self):
+        util.reset_logging()
+        util.clear_static_cache()
+
+    def tearDown(self):
+        util.reset_logging()
+        util.clear_static_cache()
+
+    def _acquire(self, transport):
+        context = adal.AuthenticationContext(
+            cp['authUrl'], validate_authority=False, transport=transport, timeout=7)
+        return context.acquire_token_with_client_credentials(
+            cp['resource'], cp['clientId'], cp['clientSecret'])
+
+    def test_requests_go_through_the_transport(self):
+        response = util.create_response({'noRefresh': True, 'tokenEndpoint': True})
+        transport = _InProcessTransport(_Response(200, response['wireResponse']))
+
+        token = self._acquire(transport)
+
+        self.assertEqual(response['wireResponse']['access_token'], token['accessToken'])
+        self.assertEqual(
+            [('POST', cp['authUrl'] + '/oauth2/token', 7)], transport.requests)
+
+    def test_unsuccessful_response_raises_adal_error(self):
+        transport = _InProcessTransport(_Response(400, {'error': 'invalid_client'}))
+
+        with self.assertRaises(adal.AdalError) as cm:
+            self._acquire(transport)
+        self.assertIn('Get Token request returned http error: 400', str(cm.exception))
+        self.assertEqual({'error': 'invalid_client'}, cm.exception.error_response)
+
+    def test_throttled_response_raises_http_error(self):
+        transport = _InProcessTransport(_Response(429, {}))
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self._acquire(transport)
+
+
+
+class TestDeadline(unittest.TestCase):
+
+    def setUp(self):
+        util.reset_logging()
+        util.clear_static_cache()
+        self.now = 1000.0
+        for name in ('http_transport', 'authentication_context', 'retry_policy'):
+            patcher = mock.patch('adal.{}._now'.format(name), lambda: self.now)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        util.reset_logging()
+        util.clear_static_cache()
+
+    def _acquire(self, transport, **kwargs):
+        # Not a well known authority, so instance discovery comes first
+        context = adal.AuthenticationContext(
+            'https://login.contoso.com/' + cp['tenant'], transport=transport, **kwargs)
+        return context.acquire_token_with_client_credentials(
+            cp['resource'], cp['clientId'], cp['clientSecret'])
+
+    def test_hops_share_the_deadline(self):
+        response = util.create_response({'noRefresh': True, 'tokenEndpoint': True})
+        transport = _SlowTransport(
+            self, 7, _Response(200, {'tenant_discovery_endpoint': 'https://contoso.com'}),
+            _Response(200, response['wireResponse']))
+
+        self._acquire(transport, timeout=5, deadline=10)
+
+        self.assertEqual([5, 3], [timeout for _, _, timeout in transport.requests])
+
+    def test_no_request_is_sent_past_the_deadline(self):
+        transport = _SlowTransport(
+            self, 11, _Response(200, {'tenant_discovery_endpoint': 'https://contoso.com'}))
+
+        with six.assertRaisesRegex(self, adal.AdalError, 'deadline'):
+            self._acquire(transport, timeout=(2, 30), deadline=10)
+        self.assertEqual([(2, 10)], [timeout for _, _, timeout in transport.requests])
+
+    def test_no_retry_waits_past_the_deadline(self):
+        throttled = _Response(429, {})
+        throttled.headers['Retry-After'] = '5'
+        transport = _SlowTransport(
+            self, 1, _Response(200, {'tenant_discovery_endpoint': 'https://contoso.com'}),
+            throttled)
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self._acquire(transport, deadline=5, retry_policy=adal.RetryPolicy())
+        self.assertEqual(2, len(transport.requests))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation. 
+# All rights reserved.
+# 
+# This code is licensed under the MIT License.
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+from datetime import datetime, timedelta
+import json
+import threading
+import unittest
+
+from dateutil import parser
+import httpretty
+
+import adal
+from adal.refresh_scheduler import RefreshScheduler
+from tests import util
+from tests.util import parameters as cp
+
+class TestRefreshScheduler(unittest.TestCase):
+
+    def setUp(self):
+        util.reset_logging()
+        util.clear_static_cache()
+
+    def _create_context(self, minutes_left):
+        entry = util.create_response({'mrrt': True})['cachedResponse']
+        entry['expiresOn'] = str(datetime.now() + timedelta(minutes=minutes_left))
+        cache = adal.TokenCache(json.dumps([entry]))
+        return adal.AuthenticationContext(cp['authorityTenant'], cache=cache)
+
+    def _cached_entry(self, context):
+        entries = [e for _, e in context.cache.read_items()]
+        self.assertEqual(1, len(entries))
+        return entries[0]
+
+    @httpretty.activate
+    def test_entry_about_to_expire_is_refreshed(self):
+        wire_response = util.create_response({'refreshedRefresh': True, 'mrrt': True})['wireResponse']
+        util.setup_expected_refresh_token_request_response(200, wire_response)
+        context = self._create_context(minutes_left=2)
+
+        RefreshScheduler(context).refresh_due_entries()
+
+        entry = self._cached_entry(context)
+        self.assertNotEqual(cp['refreshToken'], entry['refreshToken'])
+        self.assertTrue(util.is_expires_within_tolerance(parser.parse(entry['expiresOn'])))
+
+    @httpretty.activate
+    def test_fresh_entry_is_left_alone(self):
+        context = self._create_context(minutes_left=60)
+
+        delay = RefreshScheduler(context, interval=3600).refresh_due_entries()
+
+        self.assertEqual(cp['refreshToken'], self._cached_entry(context)['refreshToken'])
+        self.assertAlmostEqual(3600 - 600, delay, delta=5)
+        self.assertEqual([], httpretty.latest_requests())
+
+    def test_scan_while_the_cache_changes(self):
+        context = self._create_context(minutes_left=60)
+        scheduler = RefreshScheduler(context)
+        entry = self._cached_entry(context)
+        context.cache.add([dict(entry, userId='other{}@contoso.com'.format(i)) for i in range(200)])
+        stop = threading.Event()
+
+        def write():
+            index = 0
+            while not stop.is_set():
+                other = dict(entry, userId='user{}@contoso.com'.format(index % 50))
+                context.cache.add([other])
+                context.cache.remove([other])
+                index += 1
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            for _ in range(50):
+                scheduler.refresh_due_entries()
+        finally:
+            stop.set()
+            writer.join()
+
+        # The scan works on a snapshot, which later changes leave alone
+        items = context.cache.read_items()
+        context.cache.add([dict(entry, userId='late@contoso.com')])
+        self.assertEqual(201, len(items))
+
+    @httpretty.activate
+    def test_failed_refresh_keeps_entry_and_backs_off(self):
+        util.setup_expected_refresh_token_request_response(400, {'error': 'invalid_grant'})
+        context = self._create_context(minutes_left=2)
+        scheduler = RefreshScheduler(context, interval=30)
+
+        self.assertAlmostEqual(30, scheduler.refresh_due_entries(), delta=1)
+        failed_request = httpretty.last_request()
+        self.assertAlmostEqual(30, scheduler.refresh_due_entries(), delta=1)
+
+        self.assertIs(failed_request, httpretty.last_request())
+        self.assertEqual(cp['refreshToken'], self._cached_entry(context)['refreshToken'])
+
+    def test_background_thread_refreshes_and_stops(self):
+        context = self._create_context(minutes_left=2)
+        scheduler = RefreshScheduler(context)
+        refreshed = threading.Event()
+        scheduler._refresh = lambda entry: refreshed.set()
+
+        with scheduler:
+            self.assertTrue(refreshed.wait(5))
+
+        self.assertIsNone(scheduler._thread)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+from email.utils import formatdate
+import json
+import socket
+import ssl
+import threading
+import time
+import unittest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+import six
+
+import adal
+from adal.http_transport import HttpTransport
+from adal.retry_policy import RetryPolicy, _now, _parse_retry_after
+from tests import util
+from tests.util import parameters as cp
+
+TOKEN_RESPONSE = {
+    'access_token': 'new AT', 'refresh_token': 'new RT', 'token_type': 'Bearer',
+    'expires_in': 3600, 'resource': cp['resource']}
+
+
+class _Response(object):
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    '''Answers each request with the next of the server's responses, a
+    (status, headers) pair, and with a token once they run out.'''
+
+    def do_POST(self): # pylint: disable=invalid-name
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.times.append(time.time())
+        status, headers = self.server.responses.pop(0) if self.server.responses else (200, {})
+        body = json.dumps(TOKEN_RESPONSE if status == 200 else {}).encode('utf-8')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): # pylint: disable=arguments-differ
+        pass
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def setUp(self):
+        util.reset_logging()
+        util.clear_static_cache()
+        self.server = HTTPServer(('127.0.0.1', 0), _ThrottlingHandler)
+        server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_context.load_cert_chain(util.tls_cert_path, util.tls_key_path)
+        self.server.socket = server_context.wrap_socket(self.server.socket, server_side=True)
+        self.server.responses = []
+        self.server.times = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.authority = 'https://127.0.0.1:{}/{}'.format(
+            self.server.server_address[1], cp['tenant'])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        util.reset_logging()
+        util.clear_static_cache()
+
+    def _acquire(self, retry_policy):
+        context = adal.AuthenticationContext(
+            self.authority, validate_authority=False, verify_ssl=util.tls_cert_path,
+            retry_policy=retry_policy)
+        try:
+            return context.acquire_token_with_client_credentials(
+                cp['resource'], cp['clientId'], cp['clientSecret'])
+        finally:
+            context.close()
+
+    def test_retry_after_is_honored(self):
+        self.server.responses = [(429, {'Retry-After': '1'}), (503, {})]
+
+        token = self._acquire(RetryPolicy(base_delay=0.01, max_delay=0.05))
+
+        self.assertEqual('new AT', token['accessToken'])
+        self.assertEqual(3, len(self.server.times))
+        self.assertGreaterEqual(self.server.times[1] - self.server.times[0], 1)
+        self.assertLess(self.server.times[2] - self.server.times[1], 1)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.responses = [(503, {})] * 10
+
+        with six.assertRaisesRegex(self, adal.AdalError, 'http error: 503'):
+            self._acquire(RetryPolicy(max_retries=2, base_delay=0.01, max_delay=0.01))
+        self.assertEqual(3, len(self.server.times))
+
+    def test_does_not_wait_past_max_total(self):
+        self.server.responses = [(429, {'Retry-After': '30'})]
+
+        started = time.time()
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self._acquire(RetryPolicy(max_total=5))
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(1, len(self.server.times))
+
+    def test_nothing_is_retried_by_default(self):
+        self.server.responses = [(503, {})]
+
+        with six.assertRaisesRegex(self, adal.AdalError, 'http error: 503'):
+            self._acquire(None)
+        self.assertEqual(1, len(self.server.times))
+
+    def test_only_transient_errors_are_retried(self):
+        class InvalidUrlTransport(HttpTransport):
+            sent = 0
+            def send(self, *args, **kwargs):
+                InvalidUrlTransport.sent += 1
+                raise requests.exceptions.InvalidURL('Invalid URL')
+
+        context = adal.AuthenticationContext(
+            self.authority, validate_authority=False, transport=InvalidUrlTransport(),
+            retry_policy=RetryPolicy(base_delay=0.01, max_delay=0.01))
+        with self.assertRaises(requests.exceptions.InvalidURL):
+            context.acquire_token_with_client_credentials(
+                cp['resource'], cp['clientId'], cp['clientSecret'])
+        self.assertEqual(1, InvalidUrlTransport.sent)
+
+        policy = RetryPolicy()
+        for error in (requests.exceptions.MissingSchema(), requests.exceptions.TooManyRedirects(),
+                      OSError()):
+            self.assertFalse(policy.is_retryable(error=error))
+        for error in (requests.exceptions.ConnectionError(), requests.exceptions.ReadTimeout(),
+                      socket.timeout()):
+            self.assertTrue(policy.is_retryable(error=error))
+
+    def test_delays_are_jittered_within_bounds(self):
+        policy = RetryPolicy(max_retries=100, base_delay=1, max_delay=10, max_total=1000)
+        delays = [policy.next_delay(0, 4, _now()) for _ in range(200)]
+
+        self.assertTrue(all(1 <= delay <= 10 for delay in delays))
+        self.assertGreater(len(set(delays)), 100)
+        self.assertIsNone(policy.next_delay(100, 4, _now()))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(120, _parse_retry_after(_Response({'Retry-After': '120'})))
+        self.assertAlmostEqual(
+            60, _parse_retry_after(_Response({'Retry-After': formatdate(time.time() + 60)})),
+            delta=2)
+        self.assertIsNone(_parse_retry_after(_Response({'Retry-After': 'soon'})))
+        self.assertIsNone(_parse_retry_after(_Response({})))
+
+
+if __name__ == '__main__':
+    unittest.main()
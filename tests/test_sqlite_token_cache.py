@@ -0,0 +1,136 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from adal.token_cache import TokenCache
+from adal.sqlite_token_cache import SqliteTokenCache
+from tests.test_token_cache import _create_entry
+
+
+class TestSqliteTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tokens.db')
+        self.alice_graph = _create_entry("alice@contoso.com", "graph")
+        self.alice_vault = _create_entry("alice@contoso.com", "vault", is_mrrt=False)
+        self.bob_graph = _create_entry("bob@contoso.com", "graph")
+        self.cache = SqliteTokenCache(self.path)
+        self.cache.add([self.alice_graph, self.alice_vault, self.bob_graph])
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def _resources(self, entries):
+        return sorted(e["resource"] for e in entries)
+
+    def test_find(self):
+        found = self.cache.find({"_clientId": "CLIENT_ID", "userId": "Alice@Contoso.com"})
+        self.assertEqual(["graph", "vault"], self._resources(found))
+        found = self.cache.find({"isMRRT": True, "userId": "alice@contoso.com"})
+        self.assertEqual([self.alice_graph], found)
+        self.assertEqual(3, len(self.cache.find({})))
+
+    def test_add_replaces_and_remove_deletes(self):
+        self.cache.add([dict(self.alice_graph, userId="ALICE@contoso.com", accessToken="new AT")])
+        found = self.cache.find({"isMRRT": True, "userId": "alice@contoso.com"})
+        self.assertEqual(["new AT"], [e["accessToken"] for e in found])
+
+        self.cache.has_state_changed = False
+        self.cache.remove([self.alice_graph, self.alice_vault])
+        self.assertTrue(self.cache.has_state_changed)
+        self.assertEqual([self.bob_graph], self.cache.find({}))
+
+    def test_replace_is_one_transaction(self):
+        new_graph = dict(self.alice_graph, accessToken="new AT")
+        with self.assertRaises(Exception):
+            self.cache.replace([self.bob_graph], [new_graph, {"unserializable": object()}])
+        self.assertEqual(3, len(self.cache.find({})))
+
+        self.cache.replace([self.bob_graph, self.alice_graph], [new_graph])
+        self.assertEqual(sorted(["new AT", self.alice_vault["accessToken"]]),
+                         sorted(e["accessToken"] for e in self.cache.find({})))
+
+    def test_refresh_tokens_are_updated_in_one_write_transaction(self):
+        statements = []
+        self.cache._connection.set_trace_callback(statements.append)
+        alice_mail = dict(_create_entry("alice@contoso.com", "mail"), refreshToken="new RT")
+
+        updated = self.cache.update_refresh_tokens(
+            {"isMRRT": True, "userId": "alice@contoso.com", "_clientId": "client_id"},
+            "new RT", [], [alice_mail])
+
+        self.assertEqual([dict(self.alice_graph, refreshToken="new RT")], updated)
+        self.assertEqual("BEGIN IMMEDIATE", statements[0])
+        self.assertTrue(statements[1].startswith("SELECT"))
+        found = self.cache.find({"isMRRT": True, "userId": "alice@contoso.com"})
+        self.assertEqual(["new RT", "new RT"], [e["refreshToken"] for e in found])
+
+    def test_sweep_expired_deletes_expired_rows_without_refresh_token(self):
+        expired = dict(_create_entry("carol@contoso.com", "graph"), refreshToken=None,
+                       expiresOn="2000-01-01 00:00:00.000000")
+        renewable = dict(_create_entry("dave@contoso.com", "graph"),
+                         expiresOn="2000-01-01 00:00:00.000000")
+        self.cache.add([expired, renewable])
+
+        self.assertEqual(1, self.cache.sweep_expired())
+        self.assertEqual(4, len(self.cache.find({})))
+        self.assertEqual([], self.cache.find({"userId": "carol@contoso.com"}))
+        self.assertEqual(0, self.cache.sweep_expired())
+
+    def test_journal_is_not_supported(self):
+        self.assertRaises(NotImplementedError, self.cache.serialize_journal)
+        self.assertRaises(NotImplementedError, self.cache.should_compact)
+
+    def test_cache_is_shared_through_the_database_file(self):
+        other = SqliteTokenCache(self.path)
+        try:
+            self.assertEqual(3, len(other.read_items()))
+            other.remove([self.bob_graph])
+            self.assertEqual([], self.cache.find({"userId": "bob@contoso.com"}))
+        finally:
+            other.close()
+
+    def test_serialize_is_compatible_with_token_cache(self):
+        in_memory = TokenCache(self.cache.serialize())
+        self.assertEqual(3, len(in_memory.read_items()))
+
+        restored = SqliteTokenCache(state=in_memory.serialize())
+        try:
+            self.assertEqual(["graph", "graph", "vault"], self._resources(restored.find({})))
+            self.assertFalse(restored.has_state_changed)
+        finally:
+            restored.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,358 @@
+#------------------------------------------------------------------------------
+#
+# Copyright (c) Microsoft Corporation.
+# All rights reserved.
+#
+# This code is licensed under the MIT License.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files(the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions :
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#------------------------------------------------------------------------------
+
+import copy
+from datetime import datetime, timedelta
+import json
+import threading
+import time
+import unittest
+
+from adal.token_cache import (TokenCache, TokenCacheKey, TokenEntry, CompactTokenEntry,
+                              _ReadWriteLock)
+
+
+def _create_entry(user_id, resource, client_id="client_id", is_mrrt=True):
+    entry = {
+        "_authority": "https://login.microsoftonline.com/tenant",
+        "_clientId": client_id,
+        "resource": resource,
+        "userId": user_id,
+        "accessToken": "AT for {} {}".format(user_id, resource),
+        "refreshToken": "RT for {}".format(user_id),
+        "expiresOn": "2099-01-01 00:00:00.000000",
+        }
+    if is_mrrt:
+        entry["isMRRT"] = True
+    return entry
+
+
+class TestTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.alice_graph = _create_entry("alice@contoso.com", "graph")
+        self.alice_vault = _create_entry("alice@contoso.com", "vault", is_mrrt=False)
+        self.bob_graph = _create_entry("bob@contoso.com", "graph")
+        self.other_client = _create_entry("alice@contoso.com", "graph", client_id="other")
+        self.cache = TokenCache()
+        self.cache.add([self.alice_graph, self.alice_vault, self.bob_graph, self.other_client])
+
+    def _find(self, **query):
+        return sorted(self.cache.find(query), key=lambda e: e["accessToken"] + e["_clientId"])
+
+    def test_find_by_client_and_user_is_case_insensitive(self):
+        found = self._find(_clientId="CLIENT_ID", userId="Alice@Contoso.com")
+        self.assertEqual([self.alice_graph, self.alice_vault], found)
+
+    def test_find_mrrt_for_user(self):
+        found = self._find(isMRRT=True, userId="alice@contoso.com", _clientId="client_id")
+        self.assertEqual([self.alice_graph], found)
+
+    def test_find_with_wildcards(self):
+        self.assertEqual(4, len(self._find()))
+        self.assertEqual(3, len(self._find(isMRRT=True)))
+        self.assertEqual(3, len(self._find(_clientId="client_id")))
+        self.assertEqual([], self._find(userId="nobody@contoso.com"))
+
+    def test_remove_updates_lookups(self):
+        self.cache.remove([self.alice_graph])
+        self.assertEqual(
+            [self.alice_vault], self._find(_clientId="client_id", userId="alice@contoso.com"))
+        self.assertEqual([], self._find(isMRRT=True, userId="alice@contoso.com", _clientId="client_id"))
+
+    def test_add_replaces_entry_with_same_key(self):
+        replacement = dict(self.alice_graph, accessToken="new AT")
+        replacement.pop("isMRRT")
+        self.cache.add([replacement])
+        found = self._find(_clientId="client_id", userId="alice@contoso.com")
+        self.assertEqual([self.alice_vault, replacement], found)
+        self.assertEqual([], self._find(isMRRT=True, userId="alice@contoso.com", _clientId="client_id"))
+
+    def test_deserialize_rebuilds_lookups(self):
+        restored = TokenCache(self.cache.serialize())
+        self.assertEqual(2, len(restored.find({"_clientId": "client_id", "userId": "alice@contoso.com"})))
+        restored.deserialize(json.dumps([self.bob_graph]))
+        self.assertEqual([], restored.find({"userId": "alice@contoso.com"}))
+        self.assertEqual([self.bob_graph], restored.find({"userId": "bob@contoso.com"}))
+
+    def test_add_with_mixed_case_user_id_does_not_duplicate(self):
+        self.cache.add([dict(self.alice_graph, userId="ALICE@contoso.com", accessToken="new AT")])
+        found = self._find(isMRRT=True, _clientId="client_id", userId="alice@contoso.com")
+        self.assertEqual(["new AT"], [e["accessToken"] for e in found])
+        self.assertEqual(4, len(self.cache.read_items()))
+
+    def test_replace(self):
+        cache = TokenCache(journal=True)
+        old = _create_entry("user", "graph")
+        cache.add([old, _create_entry("other", "graph")])
+        cache.serialize()
+        new = dict(old, accessToken="new AT")
+        cache.replace([old, _create_entry("other", "graph")], [new])
+        self.assertEqual([new], cache.find({}))
+        records = [json.loads(r) for r in cache.serialize_journal().splitlines()]
+        self.assertEqual(["add", "remove"], sorted(r["op"] for r in records))
+
+
+class TestTokenCacheJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.alice = _create_entry("alice@contoso.com", "graph")
+        self.bob = _create_entry("bob@contoso.com", "graph")
+        self.cache = TokenCache(journal=True)
+        self.cache.add([self.alice])
+        self.persisted = self.cache.serialize()
+
+    def _all(self, cache):
+        return sorted(e["userId"] for _, e in cache.read_items())
+
+    def test_journal_is_empty_after_snapshot(self):
+        self.assertEqual("", self.cache.serialize_journal())
+
+    def test_snapshot_and_journal_replay(self):
+        self.cache.add([self.bob])
+        self.persisted += self.cache.serialize_journal()
+        self.cache.remove([self.alice])
+        self.persisted += self.cache.serialize_journal()
+
+        restored = TokenCache(self.persisted)
+        self.assertEqual(["bob@contoso.com"], self._all(restored))
+        self.assertEqual([self.bob], restored.find({"userId": "bob@contoso.com"}))
+
+    def test_journal_coalesces_changes_to_the_same_entry(self):
+        self.cache.add([dict(self.alice, accessToken="AT 2")])
+        self.cache.add([dict(self.alice, accessToken="AT 3")])
+        journal = self.cache.serialize_journal()
+        self.assertEqual(1, len(journal.splitlines()))
+        restored = TokenCache(self.persisted + journal)
+        self.assertEqual(["AT 3"], [e["accessToken"] for _, e in restored.read_items()])
+
+    def test_should_compact_after_threshold(self):
+        self.cache.JOURNAL_COMPACTION_THRESHOLD = 2
+        self.cache.add([self.bob])
+        self.cache.serialize_journal()
+        self.assertFalse(self.cache.should_compact())
+        self.cache.remove([self.bob])
+        self.cache.serialize_journal()
+        self.assertTrue(self.cache.should_compact())
+        self.cache.serialize()
+        self.assertFalse(self.cache.should_compact())
+
+    def test_serialize_journal_requires_journaling(self):
+        with self.assertRaises(ValueError):
+            TokenCache().serialize_journal()
+
+
+class TestBoundedTokenCache(unittest.TestCase):
+
+    def _users(self, cache):
+        return sorted(e["userId"] for _, e in cache.read_items())
+
+    def _expired(self, user_id, refresh_token=None):
+        entry = _create_entry(user_id, "graph")
+        entry["expiresOn"] = "2000-01-01 00:00:00.000000"
+        if refresh_token is None:
+            del entry["refreshToken"]
+        return entry
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TokenCache(capacity=2)
+        cache.add([_create_entry("a", "graph"), _create_entry("b", "graph")])
+        cache.find({"userId": "a"})
+        cache.add([_create_entry("c", "graph")])
+        self.assertEqual(["a", "c"], self._users(cache))
+
+    def test_dead_entries_are_evicted_before_used_ones(self):
+        cache = TokenCache(capacity=2)
+        cache.add([_create_entry("a", "graph"), self._expired("dead")])
+        cache.find({"userId": "dead"})
+        cache.add([_create_entry("c", "graph")])
+        self.assertEqual(["a", "c"], self._users(cache))
+
+    def test_sweep_keeps_entries_with_refresh_token(self):
+        cache = TokenCache(journal=True)
+        cache.add([self._expired("dead"), self._expired("renewable", "RT"), _create_entry("live", "graph")])
+        cache.serialize()
+        self.assertEqual(1, cache.sweep_expired())
+        self.assertEqual(["live", "renewable"], self._users(cache))
+        self.assertIn('"remove"', cache.serialize_journal())
+
+    def test_sweep_ignores_replaced_entries(self):
+        cache = TokenCache(capacity=10)
+        cache.add([self._expired("a")])
+        cache.add([_create_entry("a", "graph")])
+        self.assertEqual(0, cache.sweep_expired())
+        self.assertEqual(["a"], self._users(cache))
+
+
+class TestTokenEntry(unittest.TestCase):
+
+    def test_timestamp_of_local_expires_on(self):
+        expiry = datetime.now() + timedelta(hours=1)
+        entry = TokenEntry(expiresOn=str(expiry))
+        self.assertAlmostEqual(time.time() + 3600, entry.get_expires_on_timestamp(), delta=5)
+        entry.set_expires_on(expiry.replace(microsecond=0))
+        self.assertEqual(str(expiry.replace(microsecond=0)), entry["expiresOn"])
+        self.assertEqual(time.mktime(expiry.timetuple()), entry.get_expires_on_timestamp())
+
+    def test_timestamp_follows_expires_on_changes(self):
+        entry = TokenEntry(expiresOn="2000-01-01 00:00:00")
+        entry.get_expires_on_timestamp()
+        entry.update({"expiresOn": "2000-01-01T00:00:00+00:00"})
+        self.assertEqual(946684800, entry.get_expires_on_timestamp())
+        entry["expiresOn"] = "not a date"
+        self.assertIsNone(entry.get_expires_on_timestamp())
+
+    def test_is_still_a_plain_dict(self):
+        entry = TokenEntry(_create_entry("user", "graph"))
+        entry.get_expires_on_timestamp()
+        self.assertEqual(_create_entry("user", "graph"), entry)
+        self.assertEqual(entry, json.loads(json.dumps(entry)))
+        self.assertEqual(entry, copy.deepcopy(entry))
+        self.assertIsInstance(copy.deepcopy(entry), TokenEntry)
+
+    def test_deserialized_entries_are_token_entries(self):
+        cache = TokenCache(json.dumps([_create_entry("user", "graph")]))
+        self.assertIsInstance(cache.find({})[0], TokenEntry)
+
+
+class TestCompactTokenEntry(unittest.TestCase):
+
+    def test_mapping_view(self):
+        entry = dict(_create_entry("user", "graph"), custom="value", refreshToken=None)
+        compact = CompactTokenEntry(entry)
+        self.assertEqual(entry, dict(compact))
+        self.assertEqual(len(entry), len(compact))
+        self.assertEqual("value", compact["custom"])
+        self.assertIsNone(compact["refreshToken"])
+        self.assertNotIn("oid", compact)
+        self.assertRaises(KeyError, lambda: compact["oid"])
+        self.assertEqual(entry, compact.to_dict())
+        self.assertIsInstance(compact.to_dict(), TokenEntry)
+
+    def test_repeated_values_are_shared(self):
+        first = CompactTokenEntry(json.loads(json.dumps(_create_entry("user1", "graph"))))
+        second = CompactTokenEntry(json.loads(json.dumps(_create_entry("user2", "graph"))))
+        self.assertIs(first["resource"], second["resource"])
+        self.assertIs(first["_authority"], second["_authority"])
+
+    def test_expiry_follows_expires_on_changes(self):
+        entry = TokenEntry(expiresOn="2030-01-01T00:00:00+00:00")
+        entry.get_expires_on_timestamp()
+        entry["expiresOn"] = "2031-01-01T00:00:00+00:00"
+        compact = CompactTokenEntry(entry)
+        self.assertEqual(1924992000, compact.get_expires_on_timestamp())
+
+    def test_compact_cache(self):
+        entries = [_create_entry("a", "graph"), _create_entry("a", "mail"), _create_entry("b", "graph")]
+        cache = TokenCache(json.dumps(entries), compact=True)
+        self.assertEqual(
+            sorted(entries[:2], key=lambda e: e["resource"]),
+            sorted(cache.find({"userId": "a"}), key=lambda e: e["resource"]))
+        found = cache.find({"userId": "b"})[0]
+        found["accessToken"] = "changed"
+        self.assertEqual(entries[2], cache.find({"userId": "b"})[0])
+        cache.remove([found])
+        self.assertEqual(sorted(entries[:2], key=lambda e: e["resource"]),
+                         sorted(json.loads(cache.serialize()), key=lambda e: e["resource"]))
+
+
+class TestReadWriteLock(unittest.TestCase):
+
+    def _in_thread(self, func):
+        done = threading.Event()
+        def run():
+            func()
+            done.set()
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return done
+
+    def test_readers_share_the_lock(self):
+        lock = _ReadWriteLock()
+        with lock.shared():
+            def read():
+                with lock.shared():
+                    pass
+            self.assertTrue(self._in_thread(read).wait(5))
+
+    def test_writer_waits_for_readers(self):
+        lock = _ReadWriteLock()
+        def write():
+            with lock:
+                pass
+        with lock.shared():
+            written = self._in_thread(write)
+            self.assertFalse(written.wait(0.1))
+        self.assertTrue(written.wait(5))
+
+    def test_readers_wait_for_writer(self):
+        lock = _ReadWriteLock()
+        def read():
+            with lock.shared():
+                pass
+        with lock:
+            read_done = self._in_thread(read)
+            self.assertFalse(read_done.wait(0.1))
+        self.assertTrue(read_done.wait(5))
+
+    def test_reentrancy(self):
+        lock = _ReadWriteLock()
+        with lock:
+            with lock.shared():
+                with lock:
+                    pass
+        with lock.shared():
+            with lock.shared():
+                self.assertRaises(RuntimeError, lock.acquire)
+        with lock: # fully released
+            pass
+
+    def test_cache_with_concurrent_reads(self):
+        cache = TokenCache(capacity=2, concurrent_reads=True)
+        cache.add([_create_entry("a", "graph"), _create_entry("b", "graph")])
+        self.assertEqual(1, len(cache.find({"userId": "A"})))
+        cache.add([_create_entry("c", "graph")])
+        self.assertEqual(["a", "c"], sorted(e["userId"] for e in json.loads(cache.serialize())))
+
+
+class TestTokenCacheKey(unittest.TestCase):
+
+    def test_keys_differing_in_case_are_equal_and_hash_alike(self):
+        key = TokenCacheKey("https://login.microsoftonline.com/Tenant", "Graph", "Client", "Alice@contoso.com")
+        other = TokenCacheKey("https://login.microsoftonline.com/tenant", "graph", "client", "alice@CONTOSO.com")
+        self.assertEqual(key, other)
+        self.assertEqual(hash(key), hash(other))
+        self.assertEqual(1, len(set([key, other])))
+
+    def test_none_and_empty_fields_are_equal(self):
+        self.assertEqual(TokenCacheKey("a", None, "c", None), TokenCacheKey("a", "", "c", ""))
+        self.assertNotEqual(TokenCacheKey("a", "b", "c", None), TokenCacheKey("a", "b", "c", "d"))
+
+
+if __name__ == '__main__':
+    unittest.main()